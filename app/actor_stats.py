@@ -0,0 +1,206 @@
+# backend/app/actor_stats.py
+#
+# Performance statistics for collectors and testers, kept under `stats` on
+# each user document and updated with $inc at every lifecycle transition:
+#
+#   collector: assigned (batches created by or assigned to the collector),
+#              completed, collection_seconds (assignment -> stage 5) summed
+#              over timed_completions (completions with an admin assignment
+#              time; collector-created batches have none),
+#              lab_tested, lab_passed (accuracy = passed / tested)
+#   tester:    offered (published to all testers), accepted, tested,
+#              turnaround_seconds (accept -> submit)
+#
+# Averages are total / count, so they stay exact under concurrent updates.
+# The role directory is patched with the new values, so admin listings read
+# them without any aggregation. For history recorded before this existed:
+#
+#     python -m app.actor_stats      # recomputes every user's stats from batches
+
+import asyncio
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from app.database import users_col, batches_col
+from app import role_directory
+
+
+async def _inc(role: str, user_id: str | None, fields: dict):
+    if not user_id or not ObjectId.is_valid(user_id):
+        return
+    user = await users_col.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$inc": {f"stats.{k}": v for k, v in fields.items()}},
+        projection={"stats": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if user:
+        role_directory.update(role, user_id, {"stats": user["stats"]})
+
+
+def _seconds_since(start) -> float | None:
+    if isinstance(start, str):
+        try:
+            start = datetime.fromisoformat(start)
+        except ValueError:
+            return None
+    if not isinstance(start, datetime):
+        return None
+    return max((datetime.utcnow() - start).total_seconds(), 0.0)
+
+
+# ==============================
+# Lifecycle events
+# ==============================
+
+async def collector_assigned(collector_id: str):
+    await _inc("Collector", collector_id, {"assigned": 1})
+
+
+async def collector_unassigned(collector_id: str | None):
+    """The batch was reassigned to another collector."""
+    await _inc("Collector", collector_id, {"assigned": -1})
+
+
+async def collection_completed(collector_id: str, assigned_at):
+    """Stage 5 submitted for the first time; only timed if the batch was assigned."""
+    fields = {"completed": 1}
+    seconds = _seconds_since(assigned_at)
+    if seconds is not None:
+        fields.update({"timed_completions": 1, "collection_seconds": seconds})
+    await _inc("Collector", collector_id, fields)
+
+
+async def test_offered():
+    """A batch was published to every tester."""
+    await users_col.update_many({"role": "Tester"}, {"$inc": {"stats.offered": 1}})
+    for tester in role_directory.members("Tester"):
+        stats = dict(tester.get("stats") or {})
+        stats["offered"] = stats.get("offered", 0) + 1
+        role_directory.update("Tester", tester["id"], {"stats": stats})
+
+
+async def test_accepted(tester_id: str):
+    await _inc("Tester", tester_id, {"accepted": 1})
+
+
+async def test_submitted(tester_id: str, accepted_at, collector_id: str | None, passed: bool):
+    await _inc("Tester", tester_id, {"tested": 1, "turnaround_seconds": _seconds_since(accepted_at) or 0.0})
+    await _inc("Collector", collector_id, {"lab_tested": 1, "lab_passed": 1 if passed else 0})
+
+
+# ==============================
+# Display values for admin listings
+# ==============================
+
+def _ratio(part: float, whole: float) -> float | None:
+    return part / whole if whole else None
+
+
+def collector_display(user: dict) -> dict:
+    """Listing fields from stats; users without stats keep their stored values."""
+    stats = user.get("stats")
+    if not stats:
+        return {
+            "assignedBatches": user.get("assignedBatches", 0),
+            "completed": user.get("completed", 0),
+            "avgTime": user.get("avgTime", "N/A"),
+            "accuracy": user.get("accuracy", "0%"),
+        }
+    # Stats written before timed_completions existed timed every completion
+    timed = stats.get("timed_completions", stats.get("completed", 0))
+    avg = _ratio(stats.get("collection_seconds", 0), timed)
+    accuracy = _ratio(stats.get("lab_passed", 0), stats.get("lab_tested", 0))
+    return {
+        "assignedBatches": stats.get("assigned", 0),
+        "completed": stats.get("completed", 0),
+        "avgTime": f"{avg / 86400:.1f} days" if avg is not None else "N/A",
+        "accuracy": f"{accuracy * 100:.1f}%" if accuracy is not None else "N/A",
+    }
+
+
+def tester_display(user: dict) -> dict:
+    stats = user.get("stats")
+    if not stats:
+        return {
+            "turnaround": user.get("turnaround", "N/A"),
+            "acceptanceRate": user.get("acceptanceRate", "0%"),
+        }
+    turnaround = _ratio(stats.get("turnaround_seconds", 0), stats.get("tested", 0))
+    acceptance = _ratio(stats.get("accepted", 0), stats.get("offered", 0))
+    return {
+        "turnaround": f"{turnaround / 3600:.0f} hrs" if turnaround is not None else "N/A",
+        "acceptanceRate": f"{acceptance * 100:.0f}%" if acceptance is not None else "N/A",
+    }
+
+
+# ==============================
+# Backfill
+# ==============================
+
+def _seconds(end: str, start: str) -> dict:
+    return {"$divide": [{"$subtract": [end, start]}, 1000]}
+
+
+COLLECTOR_PIPELINE = [
+    {"$match": {"collector_data.id": {"$type": "string"}}},
+    {"$addFields": {"_assigned_at": {
+        "$convert": {"input": "$timeline.collection_assigned", "to": "date", "onError": None, "onNull": None}
+    }}},
+    {"$group": {
+        "_id": "$collector_data.id",
+        "assigned": {"$sum": 1},
+        "completed": {"$sum": {"$cond": [{"$ifNull": ["$growth_data.stage_5", False]}, 1, 0]}},
+        "timed_completions": {"$sum": {"$cond": [
+            {"$and": ["$_assigned_at", "$growth_data.stage_5.updated_at"]}, 1, 0,
+        ]}},
+        "collection_seconds": {"$sum": {"$cond": [
+            {"$and": ["$_assigned_at", "$growth_data.stage_5.updated_at"]},
+            _seconds("$growth_data.stage_5.updated_at", "$_assigned_at"),
+            0,
+        ]}},
+        "lab_tested": {"$sum": {"$cond": [{"$ifNull": ["$lab_data.submitted_at", False]}, 1, 0]}},
+        "lab_passed": {"$sum": {"$cond": [
+            {"$and": [{"$ifNull": ["$lab_data.submitted_at", False]}, {"$eq": ["$lab_data.results.passed", True]}]}, 1, 0
+        ]}},
+    }},
+]
+
+TESTER_PIPELINE = [
+    {"$match": {"lab_data.tester_id": {"$type": "string"}}},
+    {"$group": {
+        "_id": "$lab_data.tester_id",
+        "accepted": {"$sum": {"$cond": [{"$ifNull": ["$lab_data.accepted_at", False]}, 1, 0]}},
+        "tested": {"$sum": {"$cond": [{"$ifNull": ["$lab_data.submitted_at", False]}, 1, 0]}},
+        "turnaround_seconds": {"$sum": {"$cond": [
+            {"$and": ["$lab_data.accepted_at", "$lab_data.submitted_at"]},
+            _seconds("$lab_data.submitted_at", "$lab_data.accepted_at"),
+            0,
+        ]}},
+    }},
+]
+
+
+async def backfill() -> dict:
+    """Recomputes `stats` for every collector and tester from batch history."""
+    offered = await batches_col.count_documents({"testing_published_at": {"$exists": True}})
+    await users_col.update_many({"role": "Tester"}, {"$set": {"stats.offered": offered}})
+    updates = []
+    async for row in batches_col.aggregate(COLLECTOR_PIPELINE):
+        if ObjectId.is_valid(row["_id"]):
+            updates.append(UpdateOne(
+                {"_id": ObjectId(row.pop("_id")), "role": "Collector"}, {"$set": {"stats": row}}
+            ))
+    async for row in batches_col.aggregate(TESTER_PIPELINE):
+        if ObjectId.is_valid(row["_id"]):
+            updates.append(UpdateOne(
+                {"_id": ObjectId(row.pop("_id")), "role": "Tester"}, {"$set": {"stats": {**row, "offered": offered}}}
+            ))
+    if updates:
+        await users_col.bulk_write(updates, ordered=False)
+    return {"users_updated": len(updates), "batches_offered_to_testers": offered}
+
+
+if __name__ == "__main__":
+    print(asyncio.run(backfill()))
@@ -0,0 +1,331 @@
+# backend/app/anchor_outbox.py
+#
+# Durable outbox for Fabric anchoring.
+# Endpoints enqueue an anchor job and return immediately; a background worker
+# submits jobs to the Fabric bridge with retries and exponential backoff, then
+# writes the real tx hash back onto the batch document.
+#
+# Batch documents expose progress under `anchors.<kind>`:
+#   {"status": "pending" | "anchored" | "failed", "job_id", "tx_hash", ...}
+# Only the job named by `anchors.<kind>.job_id` may write its result back; a
+# job superseded by a newer enqueue of the same kind is closed unsubmitted.
+#
+# With ANCHOR_MODE=merkle, each payload is hashed into a leaf and the worker
+# anchors one Merkle root per time window instead of one tx per event. Every
+# batch anchor then also stores `merkle: {root, leaf, index, proof}`, which
+# verify_merkle_anchors() checks against the recorded root. The canonical
+# payload text is kept under `anchors.<kind>.payload` so the leaf itself can
+# be recomputed from what was anchored.
+
+import os
+import time
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.database import anchor_jobs_col, anchor_roots_col, batches_col
+from app.blockchain_client import create_batch
+from app.resilience import CircuitOpenError
+from app import jobs, merkle
+
+ANCHOR_MAX_ATTEMPTS = int(os.getenv("ANCHOR_MAX_ATTEMPTS", "8"))
+ANCHOR_BACKOFF_BASE = float(os.getenv("ANCHOR_BACKOFF_BASE", "2"))
+ANCHOR_BACKOFF_CAP = float(os.getenv("ANCHOR_BACKOFF_CAP", "300"))
+ANCHOR_LEASE_SECONDS = float(os.getenv("ANCHOR_LEASE_SECONDS", "60"))
+ANCHOR_POLL_INTERVAL = float(os.getenv("ANCHOR_POLL_INTERVAL", "5"))
+
+# "direct" = one Fabric tx per anchor, "merkle" = one tx per window of anchors
+ANCHOR_MODE = os.getenv("ANCHOR_MODE", "direct").lower()
+ANCHOR_MERKLE_WINDOW = float(os.getenv("ANCHOR_MERKLE_WINDOW", "30"))
+ANCHOR_MERKLE_MAX_LEAVES = int(os.getenv("ANCHOR_MERKLE_MAX_LEAVES", "1024"))
+
+# Anchor kinds raised by the batch lifecycle
+CREATION = "creation"
+FINAL = "final"
+PACKAGING = "packaging"
+
+_wakeup = asyncio.Event()
+_worker_task: asyncio.Task | None = None
+
+
+def _owned_by(job: dict) -> dict:
+    """Filter matching the batch only while this job is its current anchor of that kind."""
+    return {"batch_id": job["batch_id"], f"anchors.{job['kind']}.job_id": str(job["_id"])}
+
+
+def _success_fields(kind: str, tx_hash: str) -> dict:
+    """Batch fields written once an anchor of the given kind is confirmed."""
+    now = datetime.utcnow()
+    fields = {
+        f"anchors.{kind}.status": "anchored",
+        f"anchors.{kind}.tx_hash": tx_hash,
+        f"anchors.{kind}.anchored_at": now,
+        f"anchors.{kind}.error": None,
+    }
+    if kind == FINAL:
+        fields.update({"blockchain_tx": tx_hash, "anchored_at": now})
+    elif kind == PACKAGING:
+        fields["packaging_data.fabric_final_tx"] = tx_hash
+    return fields
+
+
+def _status_filter(job: dict) -> dict | None:
+    """
+    A FINAL anchor moves the batch to `blockchain_anchored`, but only while it
+    still has the lifecycle status it had when the job was enqueued. A batch
+    that moved on (bidding, manufacturing, packaging) keeps its status.
+    """
+    if job["kind"] != FINAL or not job.get("advance_from"):
+        return None
+    return {**_owned_by(job), "status": job["advance_from"]}
+
+
+async def _is_superseded(job: dict) -> bool:
+    """True (and the job is closed) if a newer job now owns this batch anchor."""
+    if await batches_col.count_documents(_owned_by(job), limit=1):
+        return False
+    await jobs.mark_done(anchor_jobs_col, job, superseded=True)
+    return True
+
+
+async def enqueue_anchor(batch_id: str, kind: str, payload: dict, advance_from: str | None = None) -> str:
+    """
+    Persists an anchor job and marks the batch anchor as pending.
+    `advance_from` is the batch status a FINAL anchor may replace with
+    `blockchain_anchored` once confirmed.
+    """
+    mode = "merkle" if ANCHOR_MODE == "merkle" else "direct"
+    job = jobs.new_job(
+        batch_id=batch_id, kind=kind, payload=payload, tx_hash=None, mode=mode, advance_from=advance_from,
+    )
+    if mode == "merkle":
+        job["leaf"] = merkle.leaf_hash(payload)
+    result = await anchor_jobs_col.insert_one(job)
+    job_id = str(result.inserted_id)
+
+    await batches_col.update_one(
+        {"batch_id": batch_id},
+        {"$set": {f"anchors.{kind}": {
+            "status": "pending",
+            "job_id": job_id,
+            "payload": merkle.canonical(payload),
+            "queued_at": job["createdAt"],
+            "tx_hash": None,
+            "error": None,
+        }}}
+    )
+    # Merkle leaves wait for the next window; direct jobs go out right away
+    if mode == "direct":
+        _wakeup.set()
+    return job_id
+
+
+async def retry_anchor(job_id: str) -> dict | None:
+    """Re-queues a failed anchor job. Returns None if it is not in failed state."""
+    if not ObjectId.is_valid(job_id):
+        return None
+    job = await jobs.reset_failed(anchor_jobs_col, ObjectId(job_id))
+    if not job:
+        return None
+
+    await batches_col.update_one(_owned_by(job), {"$set": {f"anchors.{job['kind']}.status": "pending"}})
+    if job.get("mode") != "merkle":
+        _wakeup.set()
+    return job
+
+
+async def _record_failure(job: dict, error: str):
+    """Reschedules a failed job and mirrors the error (or parked state) on the batch."""
+    parked = await jobs.mark_failed(
+        anchor_jobs_col, job, error,
+        ANCHOR_MAX_ATTEMPTS, ANCHOR_BACKOFF_BASE, ANCHOR_BACKOFF_CAP,
+    )
+    fields = {f"anchors.{job['kind']}.error": error}
+    if parked:
+        fields[f"anchors.{job['kind']}.status"] = "failed"
+        print(f"Anchor job {job['_id']} for {job['batch_id']} failed permanently: {error}")
+    await batches_col.update_one(_owned_by(job), {"$set": fields})
+
+
+async def process_job(job: dict):
+    """Submits a single claimed job to the Fabric bridge."""
+    if await _is_superseded(job):
+        return
+    try:
+        response = await create_batch(job["payload"])
+        tx_hash = response.get("txHash")
+        if not tx_hash:
+            raise ValueError("Fabric bridge did not return a transaction hash.")
+    except CircuitOpenError as e:
+        await jobs.defer(anchor_jobs_col, job, e.retry_after, str(e))
+        return
+    except Exception as e:
+        await _record_failure(job, str(e) or e.__class__.__name__)
+        return
+
+    await jobs.mark_done(anchor_jobs_col, job, tx_hash=tx_hash)
+    status_filter = _status_filter(job)
+    if status_filter:
+        await batches_col.update_one(status_filter, {"$set": {"status": "blockchain_anchored"}})
+    await batches_col.update_one(_owned_by(job), {"$set": _success_fields(job["kind"], tx_hash)})
+
+
+async def _claim_merkle_round() -> list[dict]:
+    """Claims up to ANCHOR_MERKLE_MAX_LEAVES due leaves under a fresh round id."""
+    now = datetime.utcnow()
+    due = {
+        "mode": "merkle",
+        "$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "in_flight", "lease_until": {"$lte": now}},
+        ],
+    }
+    candidates = await anchor_jobs_col.find(due, {"_id": 1}) \
+        .sort("next_attempt_at", 1).to_list(length=ANCHOR_MERKLE_MAX_LEAVES)
+    if not candidates:
+        return []
+
+    # Re-check `due` so leaves claimed by another process in between are skipped
+    round_id = uuid.uuid4().hex
+    await anchor_jobs_col.update_many(
+        {"$and": [{"_id": {"$in": [c["_id"] for c in candidates]}}, due]},
+        {
+            "$set": {
+                "status": "in_flight",
+                "round_id": round_id,
+                "lease_until": now + timedelta(seconds=ANCHOR_LEASE_SECONDS),
+                "updatedAt": now,
+            },
+            "$inc": {"attempts": 1},
+        }
+    )
+    return await anchor_jobs_col.find({"round_id": round_id}).sort("_id", 1).to_list(length=None)
+
+
+async def process_merkle_round():
+    """Anchors one Merkle root covering every due leaf."""
+    leaves = [job for job in await _claim_merkle_round() if not await _is_superseded(job)]
+    if not leaves:
+        return
+
+    root, proofs = merkle.build_tree([job["leaf"] for job in leaves])
+    try:
+        response = await create_batch({
+            "batchId": f"MERKLE-{root[:16].upper()}",
+            "merkleRoot": root,
+            "leafCount": len(leaves),
+            "timestamp": datetime.utcnow().isoformat(),
+        })
+        tx_hash = response.get("txHash")
+        if not tx_hash:
+            raise ValueError("Fabric bridge did not return a transaction hash.")
+    except CircuitOpenError as e:
+        for job in leaves:
+            await jobs.defer(anchor_jobs_col, job, e.retry_after, str(e))
+        return
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+        for job in leaves:
+            await _record_failure(job, error)
+        print(f"Merkle anchor round of {len(leaves)} leaves failed: {error}")
+        return
+
+    await anchor_roots_col.update_one(
+        {"_id": root},
+        {"$set": {"tx_hash": tx_hash, "leaf_count": len(leaves), "createdAt": datetime.utcnow()}},
+        upsert=True,
+    )
+
+    batch_updates = []
+    for index, (job, proof) in enumerate(zip(leaves, proofs)):
+        inclusion = {"root": root, "leaf": job["leaf"], "index": index, "proof": proof}
+        await jobs.mark_done(anchor_jobs_col, job, tx_hash=tx_hash, merkle=inclusion)
+        batch_updates.append(UpdateOne(
+            _owned_by(job),
+            {"$set": {
+                **_success_fields(job["kind"], tx_hash),
+                f"anchors.{job['kind']}.merkle": inclusion,
+            }}
+        ))
+        status_filter = _status_filter(job)
+        if status_filter:
+            batch_updates.append(UpdateOne(status_filter, {"$set": {"status": "blockchain_anchored"}}))
+    await batches_col.bulk_write(batch_updates, ordered=False)
+
+
+async def verify_merkle_anchors(anchors: dict) -> dict[str, bool]:
+    """
+    Checks each Merkle-anchored entry of a batch's `anchors` map locally:
+    the stored payload must hash to the leaf, the inclusion proof must
+    rebuild the root, and that root must have been anchored under the tx
+    hash the batch claims. Returns {kind: verified}.
+    """
+    inclusions = {
+        kind: anchor["merkle"]
+        for kind, anchor in (anchors or {}).items()
+        if isinstance(anchor, dict) and anchor.get("merkle")
+    }
+    if not inclusions:
+        return {}
+
+    roots = {
+        doc["_id"]: doc.get("tx_hash")
+        async for doc in anchor_roots_col.find({"_id": {"$in": [m.get("root") for m in inclusions.values()]}})
+    }
+    return {
+        kind: isinstance(anchors[kind].get("payload"), str)
+        and merkle.canonical_leaf_hash(anchors[kind]["payload"]) == m.get("leaf")
+        and merkle.verify_proof(m.get("leaf"), m.get("proof", []), m.get("root"))
+        and m.get("root") in roots
+        and roots[m.get("root")] == anchors[kind].get("tx_hash")
+        for kind, m in inclusions.items()
+    }
+
+
+async def run_worker():
+    """
+    Drains due direct jobs, then sleeps until woken or the poll interval.
+    Merkle rounds run once per ANCHOR_MERKLE_WINDOW regardless of the current
+    mode, so leaves left over from a mode switch still get anchored.
+    """
+    next_round = time.monotonic() + ANCHOR_MERKLE_WINDOW
+    while True:
+        try:
+            if time.monotonic() >= next_round:
+                next_round = time.monotonic() + ANCHOR_MERKLE_WINDOW
+                await process_merkle_round()
+
+            job = await jobs.claim_next(anchor_jobs_col, ANCHOR_LEASE_SECONDS, {"mode": {"$ne": "merkle"}})
+            if job:
+                await process_job(job)
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Anchor worker error: {e}")
+
+        _wakeup.clear()
+        timeout = min(ANCHOR_POLL_INTERVAL, max(next_round - time.monotonic(), 0))
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start():
+    global _worker_task
+    if _worker_task is None or _worker_task.done():
+        _worker_task = asyncio.create_task(run_worker())
+
+
+async def stop():
+    global _worker_task
+    if _worker_task:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
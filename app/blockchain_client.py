@@ -1,34 +1,40 @@
 # backend/app/blockchain_client.py (FINAL, FIXED VERSION)
 import os
 import httpx
-from datetime import datetime
-import uuid
+from app.http_clients import get_client
+from app.resilience import get_breaker, CircuitOpenError
 
 # --- Separate Configuration Constants ---
 FABRIC_BRIDGE_URL = os.getenv("FABRIC_BRIDGE_URL", "http://localhost:3000") 
 POLYGON_VERIFICATION_URL = os.getenv("POLYGON_VERIFICATION_URL", "http://4.213.152.206:3000") 
 # ----------------------------------------
 
+# Fail fast instead of waiting out the full timeout when an upstream is down
+fabric_breaker = get_breaker("fabric")
+polygon_breaker = get_breaker("polygon")
+
 
 async def create_batch(payload: dict) -> dict:
-    """Anchors data to the private chain (Hyperledger Fabric mock)."""
-    try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.post(f"{FABRIC_BRIDGE_URL}/batches", json=payload)
+    """
+    Anchors data to the private chain (Hyperledger Fabric mock).
+    Raises httpx.HTTPError on failure (CircuitOpenError while the bridge is
+    considered down); callers in the request path should go through
+    app.anchor_outbox instead of calling this directly.
+    """
+    async with fabric_breaker:
+        resp = await get_client("fabric").post(f"{FABRIC_BRIDGE_URL}/batches", json=payload)
         resp.raise_for_status()
-        return resp.json() 
-    except Exception as e:
-        print(f"Fabric bridge anchor failed: {e}")
-        return {"error": "Fabric anchor failed", "txHash": f"0xFABRIC_FAIL_{uuid.uuid4().hex[:12]}"}
+    return resp.json()
 
 async def get_batch(batch_id: str) -> dict:
     """Retrieves batch data from the Fabric bridge."""
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            # FIX: Use FABRIC_BRIDGE_URL
-            resp = await client.get(f"{FABRIC_BRIDGE_URL}/batches/{batch_id}")
-        resp.raise_for_status()
+        async with fabric_breaker:
+            resp = await get_client("fabric").get(f"{FABRIC_BRIDGE_URL}/batches/{batch_id}")
+            resp.raise_for_status()
         return resp.json()
+    except CircuitOpenError:
+        raise
     except Exception as e:
         raise httpx.HTTPError(f"Failed to fetch batch from Fabric bridge: {e}")
 
@@ -36,11 +42,12 @@ async def get_batch(batch_id: str) -> dict:
 async def list_batches() -> dict:
     """Retrieves list of all batches from the Fabric bridge."""
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            # FIX: Use FABRIC_BRIDGE_URL
-            resp = await client.get(f"{FABRIC_BRIDGE_URL}/batches")
-        resp.raise_for_status()
+        async with fabric_breaker:
+            resp = await get_client("fabric").get(f"{FABRIC_BRIDGE_URL}/batches")
+            resp.raise_for_status()
         return resp.json()
+    except CircuitOpenError:
+        raise
     except Exception as e:
         raise httpx.HTTPError(f"Failed to list batches from Fabric bridge: {e}")
 
@@ -48,13 +55,17 @@ async def list_batches() -> dict:
 async def verify_token(token_id: str) -> dict:
     """Calls the live public chain API to verify NFT existence."""
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(f"{POLYGON_VERIFICATION_URL}/verify/token/{token_id}")
-        resp.raise_for_status()
+        async with polygon_breaker:
+            resp = await get_client("polygon").get(f"{POLYGON_VERIFICATION_URL}/verify/token/{token_id}")
+            resp.raise_for_status()
         return resp.json() 
+    except CircuitOpenError:
+        return {"verified": False, "degraded": True, "error": "Public chain service temporarily unavailable"}
     except httpx.HTTPStatusError as e:
         print(f"Public chain token verification failed (HTTP status {e.response.status_code}): {e.response.text}")
-        return {"verified": False, "error": f"Verification failed: {e.response.text}"}
+        # 5xx / 429 say nothing about the token itself, only 4xx answers are definitive
+        transient = e.response.status_code >= 500 or e.response.status_code == 429
+        return {"verified": False, "degraded": transient, "error": f"Verification failed: {e.response.text}"}
     except Exception as e:
         print(f"Public chain network error: {e}")
-        return {"verified": False, "error": "Public chain service unreachable"}
\ No newline at end of file
+        return {"verified": False, "degraded": True, "error": "Public chain service unreachable"}
\ No newline at end of file
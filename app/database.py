@@ -1,4 +1,5 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
 import os
 from datetime import datetime
 
@@ -16,6 +17,65 @@ quotes_col = database["quotes"]
 manufacturing_col = database["manufacturing"]
 packaging_col = database["packaging"]
 notification_collection = database["notifications"]
+anchor_jobs_col = database["anchor_jobs"]
+anchor_roots_col = database["anchor_roots"]
+media_index_col = database["media_index"]  # sha256 of content -> IPFS CID
+media_jobs_col = database["media_jobs"]
+scan_snapshots_col = database["scan_snapshots"]  # packaged unit_id -> public scan payload
+rate_limits_col = database["rate_limits"]  # shared token buckets (RATE_LIMIT_BACKEND=mongo)
+geocode_cache_col = database["geocode_cache"]  # quantized "lat,lon" -> Nominatim result
+
+
+# Set by ensure_indexes once users.email is unique in Mongo; until then
+# registration checks for an existing email itself.
+_email_index_ready = False
+
+
+def email_index_ready() -> bool:
+    return _email_index_ready
+
+
+async def ensure_indexes():
+    """Creates the indexes the API relies on. Safe to run on every startup."""
+    global _email_index_ready
+    await anchor_jobs_col.create_index([("status", 1), ("next_attempt_at", 1)])
+    await anchor_jobs_col.create_index("batch_id")
+    await anchor_jobs_col.create_index("round_id", sparse=True)
+    await media_jobs_col.create_index([("spool_host", 1), ("status", 1), ("next_attempt_at", 1)])
+    await scan_snapshots_col.create_index("batch_id")
+    # Public scan identifier resolution (unit ID or batch ID)
+    await batches_col.create_index("batch_id")
+    await batches_col.create_index("packaging_data.unit_id", sparse=True)
+    await rate_limits_col.create_index("expires_at", expireAfterSeconds=0)
+    await geocode_cache_col.create_index("expires_at", expireAfterSeconds=0)
+    # Admin batch search: text search plus facet filters in createdAt order
+    await batches_col.create_index(
+        [("herb_name", "text"), ("farmer_name", "text"), ("location", "text")],
+        name="batches_text",
+    )
+    await batches_col.create_index([("createdAt", 1), ("_id", 1)])
+    # Farm locations (see app/geo.py)
+    await batches_col.create_index([("geo", "2dsphere")])
+    await batches_col.create_index([("status", 1), ("createdAt", 1), ("_id", 1)])
+    await batches_col.create_index([("collector_data.id", 1), ("createdAt", 1), ("_id", 1)])
+    await batches_col.create_index([("lab_data.tester_id", 1), ("createdAt", 1), ("_id", 1)])
+    # Admin user listings: search, filter and keyset sort within a role
+    await users_col.create_index(
+        [("role", 1), ("fullName", "text"), ("region", "text"), ("labName", "text"), ("companyName", "text")],
+        name="users_role_text",
+    )
+    await users_col.create_index([("role", 1), ("fullName", 1), ("_id", 1)])
+    await users_col.create_index([("role", 1), ("status", 1), ("fullName", 1), ("_id", 1)])
+    await users_col.create_index([("role", 1), ("region", 1), ("fullName", 1), ("_id", 1)])
+    await users_col.create_index([("role", 1), ("rating", 1), ("_id", 1)])
+    await users_col.create_index([("role", 1), ("createdAt", 1), ("_id", 1)])
+    try:
+        # Registration relies on this to reject duplicate emails
+        await users_col.create_index("email", unique=True)
+        _email_index_ready = True
+    except OperationFailure as e:
+        print(f"WARNING: unique email index not created (duplicate users?), "
+              f"falling back to per-registration email checks: {e}")
 
 
 # ==============================
@@ -0,0 +1,203 @@
+# backend/app/gateway_pool.py
+#
+# Latency-aware selection across several IPFS gateways.
+# A background loop probes every gateway in IPFS_GATEWAYS; probe results and
+# real proxied fetches feed an EWMA of time-to-first-byte per gateway.
+# best() returns the fastest healthy gateway for public URLs, and
+# open_hedged() sends a second request to the runner-up when the first one
+# is slower than that gateway's usual GATEWAY_HEDGE_PERCENTILE latency.
+
+import os
+import time
+import asyncio
+from collections import deque
+
+from app.http_clients import get_client
+from app import metrics
+
+IPFS_GATEWAYS = [
+    g.strip().rstrip("/") + "/"
+    for g in os.getenv("IPFS_GATEWAYS", os.getenv("IPFS_GATEWAY_PUBLIC", "https://ipfs.io/ipfs/")).split(",")
+    if g.strip()
+]
+# Small, always-available object used for health probes (the empty directory)
+GATEWAY_PROBE_CID = os.getenv("GATEWAY_PROBE_CID", "QmUNLLsPACCz1vLxQVkXqqLX5R1X345qqfHbsf67hvA3Nn")
+GATEWAY_PROBE_INTERVAL = float(os.getenv("GATEWAY_PROBE_INTERVAL", "30"))
+GATEWAY_PROBE_TIMEOUT = float(os.getenv("GATEWAY_PROBE_TIMEOUT", "5"))
+GATEWAY_EWMA_ALPHA = float(os.getenv("GATEWAY_EWMA_ALPHA", "0.3"))
+GATEWAY_UNHEALTHY_AFTER = int(os.getenv("GATEWAY_UNHEALTHY_AFTER", "3"))
+GATEWAY_HEDGE_PERCENTILE = float(os.getenv("GATEWAY_HEDGE_PERCENTILE", "0.95"))
+GATEWAY_HEDGE_MIN_DELAY = float(os.getenv("GATEWAY_HEDGE_MIN_DELAY", "0.05"))
+
+
+class GatewayError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Gateway:
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.ewma: float | None = None
+        self.samples: deque[float] = deque(maxlen=200)
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.hedges_fired = 0
+
+    def record_success(self, latency: float):
+        self.ewma = latency if self.ewma is None else (
+            GATEWAY_EWMA_ALPHA * latency + (1 - GATEWAY_EWMA_ALPHA) * self.ewma
+        )
+        self.samples.append(latency)
+        self.consecutive_failures = 0
+        self.healthy = True
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= GATEWAY_UNHEALTHY_AFTER:
+            self.healthy = False
+
+    def percentile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def snapshot(self) -> dict:
+        p = self.percentile(GATEWAY_HEDGE_PERCENTILE)
+        return {
+            "healthy": self.healthy,
+            "ewma_ms": round(self.ewma * 1000, 1) if self.ewma is not None else None,
+            "hedge_threshold_ms": round(p * 1000, 1) if p is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "hedges_fired": self.hedges_fired,
+        }
+
+
+_gateways = [Gateway(url) for url in IPFS_GATEWAYS]
+_probe_task: asyncio.Task | None = None
+
+
+def ranked() -> list[Gateway]:
+    """Healthy gateways first, fastest EWMA first; unmeasured ones keep config order."""
+    return sorted(
+        _gateways,
+        key=lambda g: (not g.healthy, g.ewma if g.ewma is not None else float("inf")),
+    )
+
+
+def best() -> str:
+    """Base URL of the currently fastest healthy gateway."""
+    return ranked()[0].base_url
+
+
+async def _probe(gateway: Gateway):
+    started = time.monotonic()
+    try:
+        resp = await get_client("gateway").head(
+            gateway.base_url + GATEWAY_PROBE_CID, timeout=GATEWAY_PROBE_TIMEOUT
+        )
+        if resp.status_code >= 400:
+            raise GatewayError(resp.status_code, f"probe answered {resp.status_code}")
+        gateway.record_success(time.monotonic() - started)
+    except Exception:
+        gateway.record_failure()
+
+
+async def run_prober():
+    while True:
+        await asyncio.gather(*(_probe(g) for g in _gateways))
+        await asyncio.sleep(GATEWAY_PROBE_INTERVAL)
+
+
+def start():
+    global _probe_task
+    if _probe_task is None or _probe_task.done():
+        _probe_task = asyncio.create_task(run_prober())
+
+
+async def stop():
+    global _probe_task
+    if _probe_task:
+        _probe_task.cancel()
+        try:
+            await _probe_task
+        except asyncio.CancelledError:
+            pass
+        _probe_task = None
+
+
+async def _open(gateway: Gateway, cid: str, byte_range: str | None = None):
+    """Streamed GET of `cid` (or a byte range of it) on one gateway; records latency to headers."""
+    client = get_client("gateway")
+    # Uncompressed, so Content-Length and byte ranges refer to the bytes we relay
+    headers = {"Accept-Encoding": "identity"}
+    if byte_range:
+        headers["Range"] = byte_range
+    started = time.monotonic()
+    try:
+        response = await client.send(client.build_request("GET", gateway.base_url + cid, headers=headers), stream=True)
+    except Exception:
+        gateway.record_failure()
+        raise
+    if response.status_code not in (200, 206):
+        await response.aclose()
+        if response.status_code not in (404, 416):
+            gateway.record_failure()
+        status = response.status_code if response.status_code in (404, 416) else 502
+        raise GatewayError(status, f"Gateway answered {response.status_code}")
+    gateway.record_success(time.monotonic() - started)
+    return response
+
+
+async def open_hedged(cid: str, byte_range: str | None = None):
+    """
+    Opens a streamed response for `cid` from the best gateway, hedging to the
+    runner-up if the first has not answered within its latency percentile.
+    With `byte_range` (a Range header value) the gateway may answer 206.
+    The caller owns (and must aclose) the returned response.
+    """
+    order = ranked()
+    primary = asyncio.create_task(_open(order[0], cid, byte_range))
+    tasks = [primary]
+    winner: asyncio.Task | None = None
+    try:
+        if len(order) == 1:
+            await asyncio.wait(tasks)
+            winner = primary
+            return primary.result()
+
+        delay = max(order[0].percentile(GATEWAY_HEDGE_PERCENTILE) or GATEWAY_PROBE_TIMEOUT, GATEWAY_HEDGE_MIN_DELAY)
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done and not primary.exception():
+            winner = primary
+            return primary.result()
+
+        order[0].hedges_fired += 1
+        tasks.append(asyncio.create_task(_open(order[1], cid, byte_range)))
+        pending = set(tasks)
+        last_error: Exception | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        # Release the loser's connection, or every attempt's if the caller
+        # was cancelled (client disconnect) before a response was handed over
+        for task in tasks:
+            if task is not winner:
+                task.cancel()
+                task.add_done_callback(_close_if_opened)
+
+
+def _close_if_opened(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is None:
+        asyncio.create_task(task.result().aclose())
+
+
+metrics.register("ipfs_gateways", lambda: {g.base_url: g.snapshot() for g in _gateways})
@@ -0,0 +1,61 @@
+# backend/app/geo.py
+#
+# Batch coordinates as GeoJSON.
+# BatchCreate.coords is free text ("12.9716, 77.5946", "(12.97 77.59)", ...)
+# and stays in `location` as entered; a parsed Point goes to `geo`, which the
+# 2dsphere index (see ensure_indexes) serves for proximity and heatmap
+# queries. Batches stored before this existed are converted with:
+#
+#     python -m app.geo
+
+import re
+import asyncio
+from pymongo import UpdateOne
+
+from app.database import batches_col
+
+_NUMBER = re.compile(r"[-+]?\d+(?:\.\d+)?")
+MIGRATION_CHUNK = 500
+
+
+def parse_coords(coords) -> dict | None:
+    """
+    "lat, lon" text -> GeoJSON Point ([lon, lat]); None if it isn't one.
+    Pairs only valid the other way round (lon first) are swapped.
+    """
+    if not isinstance(coords, str):
+        return None
+    numbers = _NUMBER.findall(coords)
+    if len(numbers) != 2:
+        return None
+    lat, lon = float(numbers[0]), float(numbers[1])
+    if abs(lat) > 90 and abs(lon) <= 90:
+        lat, lon = lon, lat
+    if abs(lat) > 90 or abs(lon) > 180:
+        return None
+    return point(lat, lon)
+
+
+def point(lat: float, lon: float) -> dict:
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+async def migrate() -> dict:
+    """Adds `geo` to every batch that has not been parsed yet (None if unparseable)."""
+    converted = skipped = 0
+    updates = []
+    async for batch in batches_col.find({"geo": {"$exists": False}}, {"location": 1}):
+        geo = parse_coords(batch.get("location"))
+        converted += geo is not None
+        skipped += geo is None
+        updates.append(UpdateOne({"_id": batch["_id"]}, {"$set": {"geo": geo}}))
+        if len(updates) >= MIGRATION_CHUNK:
+            await batches_col.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await batches_col.bulk_write(updates, ordered=False)
+    return {"converted": converted, "unparseable": skipped}
+
+
+if __name__ == "__main__":
+    print(asyncio.run(migrate()))
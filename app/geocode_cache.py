@@ -0,0 +1,132 @@
+# backend/app/geocode_cache.py
+#
+# Reverse geocoding through Nominatim with two cache tiers.
+# Coordinates are rounded to GEOCODE_PRECISION decimals (4 = ~11 m) so the
+# repeated, nearly identical lookups of one farm share an entry:
+#   1. in-memory LRU (GEOCODE_MEMORY_SIZE entries)
+#   2. geocode_cache collection, expired by a TTL index after GEOCODE_TTL_DAYS
+# Concurrent misses for the same cell share one upstream call, and upstream
+# calls from this process are paced by a token bucket (Nominatim's usage
+# policy allows ~1 req/s); callers wait for a token up to GEOCODE_MAX_WAIT.
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from app.database import geocode_cache_col
+from app.http_clients import get_client
+from app import metrics
+
+NOMINATIM_REVERSE_URL = os.getenv("NOMINATIM_REVERSE_URL", "https://nominatim.openstreetmap.org/reverse")
+NOMINATIM_USER_AGENT = os.getenv("NOMINATIM_USER_AGENT", "VirtuHerbChain/1.0")
+GEOCODE_PRECISION = int(os.getenv("GEOCODE_PRECISION", "4"))
+GEOCODE_MEMORY_SIZE = int(os.getenv("GEOCODE_MEMORY_SIZE", "10000"))
+GEOCODE_TTL_DAYS = float(os.getenv("GEOCODE_TTL_DAYS", "30"))
+GEOCODE_RATE = float(os.getenv("GEOCODE_RATE", "1"))
+GEOCODE_BURST = int(os.getenv("GEOCODE_BURST", "1"))
+GEOCODE_MAX_WAIT = float(os.getenv("GEOCODE_MAX_WAIT", "10"))
+
+
+class GeocodeBusy(Exception):
+    """The upstream token bucket is backed up beyond GEOCODE_MAX_WAIT."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Geocoding is busy, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+_memory: OrderedDict[str, dict] = OrderedDict()
+_inflight: dict[str, asyncio.Task] = {}
+# Token bucket as a "theoretical arrival time": the next moment a token is free
+_next_token_at = 0.0
+_stats = {"memory_hits": 0, "store_hits": 0, "upstream": 0, "coalesced": 0, "rejected_busy": 0, "wait_seconds": 0.0}
+
+
+def cache_key(lat: float, lon: float) -> str:
+    return f"{lat:.{GEOCODE_PRECISION}f},{lon:.{GEOCODE_PRECISION}f}"
+
+
+def _remember(key: str, result: dict):
+    _memory[key] = result
+    _memory.move_to_end(key)
+    while len(_memory) > GEOCODE_MEMORY_SIZE:
+        _memory.popitem(last=False)
+
+
+async def _take_token():
+    """Waits for an upstream slot; raises GeocodeBusy if the queue is too long."""
+    global _next_token_at
+    now = time.monotonic()
+    interval = 1 / GEOCODE_RATE
+    start = max(_next_token_at, now - (GEOCODE_BURST - 1) * interval)
+    wait = max(start - now, 0.0)
+    if wait > GEOCODE_MAX_WAIT:
+        _stats["rejected_busy"] += 1
+        raise GeocodeBusy(wait)
+    # Reserve the slot before sleeping so concurrent callers queue behind it
+    _next_token_at = start + interval
+    if wait:
+        _stats["wait_seconds"] += wait
+        await asyncio.sleep(wait)
+
+
+async def _load(key: str) -> dict:
+    doc = await geocode_cache_col.find_one({"_id": key})
+    if doc:
+        _stats["store_hits"] += 1
+        _remember(key, doc["result"])
+        return doc["result"]
+
+    await _take_token()
+    _stats["upstream"] += 1
+    lat, lon = key.split(",")
+    res = await get_client("nominatim").get(
+        NOMINATIM_REVERSE_URL,
+        params={"lat": lat, "lon": lon, "format": "json"},
+        headers={"User-Agent": NOMINATIM_USER_AGENT},
+    )
+    res.raise_for_status()
+    result = res.json()
+
+    _remember(key, result)
+    await geocode_cache_col.replace_one(
+        {"_id": key},
+        {"result": result, "expires_at": datetime.utcnow() + timedelta(days=GEOCODE_TTL_DAYS)},
+        upsert=True,
+    )
+    return result
+
+
+async def reverse(lat: float, lon: float) -> dict:
+    """Nominatim reverse-geocode result for the cell containing (lat, lon)."""
+    key = cache_key(lat, lon)
+    result = _memory.get(key)
+    if result is not None:
+        _stats["memory_hits"] += 1
+        _memory.move_to_end(key)
+        return result
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_load(key))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        _stats["coalesced"] += 1
+    # shield: one caller disconnecting must not cancel the shared lookup
+    return await asyncio.shield(task)
+
+
+def stats() -> dict:
+    return {
+        **_stats,
+        "wait_seconds": round(_stats["wait_seconds"], 3),
+        "memory_entries": len(_memory),
+        "inflight": len(_inflight),
+        "precision": GEOCODE_PRECISION,
+    }
+
+
+metrics.register("geocode_cache", stats)
@@ -0,0 +1,91 @@
+# backend/app/http_clients.py
+#
+# Shared, pooled httpx clients - one per upstream service.
+# Clients are opened in the FastAPI lifespan (see app/main.py) and reused by
+# every request, so TCP/TLS handshakes are paid once per connection instead
+# of once per call.
+
+import os
+import importlib.util
+import httpx
+
+# --- Pool tuning (shared by all upstreams) ---
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]").
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+# --- Per-upstream timeouts: (connect, read) in seconds ---
+UPSTREAM_TIMEOUTS = {
+    "fabric": (
+        float(os.getenv("FABRIC_CONNECT_TIMEOUT", "3")),
+        float(os.getenv("FABRIC_READ_TIMEOUT", "15")),
+    ),
+    "polygon": (
+        float(os.getenv("POLYGON_CONNECT_TIMEOUT", "3")),
+        float(os.getenv("POLYGON_READ_TIMEOUT", "10")),
+    ),
+    "ipfs": (
+        float(os.getenv("IPFS_CONNECT_TIMEOUT", "5")),
+        float(os.getenv("IPFS_READ_TIMEOUT", "30")),
+    ),
+    "gateway": (
+        float(os.getenv("GATEWAY_CONNECT_TIMEOUT", "3")),
+        float(os.getenv("GATEWAY_READ_TIMEOUT", "30")),
+    ),
+    "nominatim": (
+        float(os.getenv("NOMINATIM_CONNECT_TIMEOUT", "3")),
+        float(os.getenv("NOMINATIM_READ_TIMEOUT", "10")),
+    ),
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        print("HTTP2_ENABLED is set but the 'h2' package is missing; using HTTP/1.1.")
+        return False
+    return True
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    connect, read = UPSTREAM_TIMEOUTS[name]
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(read, connect=connect),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=_http2_available(),
+    )
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """
+    Returns the shared client for an upstream. Falls back to creating it
+    lazily so scripts that never run the app lifespan still work.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(name)
+        _clients[name] = client
+    return client
+
+
+async def startup():
+    """Opens one pooled client per configured upstream."""
+    for name in UPSTREAM_TIMEOUTS:
+        get_client(name)
+
+
+async def shutdown():
+    """Closes all pooled clients and their keep-alive connections."""
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
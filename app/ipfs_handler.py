@@ -2,6 +2,9 @@
 
 import httpx
 import os
+import uuid
+from app.http_clients import get_client
+from app import gateway_pool
 
 # --- NEW/MODIFIED ENVIRONMENT VARIABLES ---
 # 1. Local Gateway (For prototype testing, based on your log)
@@ -11,6 +14,11 @@ IPFS_GATEWAY_LOCAL = os.getenv("IPFS_GATEWAY_LOCAL", "http://127.0.0.1:8080/ipfs
 # Set in .env: IPFS_GATEWAY_PUBLIC="https://ipfs.io/ipfs/" (or Pinata)
 IPFS_GATEWAY_PUBLIC = os.getenv("IPFS_GATEWAY_PUBLIC", "https://ipfs.io/ipfs/")
 
+# Optional: public base URL of this API's caching proxy, e.g.
+# "https://api.example.com/api/media". When set, consumer-facing URLs point at
+# /api/media/{cid} instead of a raw gateway.
+MEDIA_PROXY_BASE_URL = os.getenv("MEDIA_PROXY_BASE_URL")
+
 def get_public_url(cid: str, is_local_dev: bool = False) -> str:
     """
     Resolves an IPFS hash (CID) to a URL, prioritizing local gateway 
@@ -18,14 +26,18 @@ def get_public_url(cid: str, is_local_dev: bool = False) -> str:
     """
     if not cid:
         return ""
+
+    if MEDIA_PROXY_BASE_URL and not is_local_dev:
+        return f"{MEDIA_PROXY_BASE_URL.rstrip('/')}/{cid}"
     
     # 1. Determine the Base URL to use
     if is_local_dev:
         # If running locally, use the local gateway URL
         base_url = IPFS_GATEWAY_LOCAL
     else:
-        # For all other cases (production, public testing), use the public fallback
-        base_url = IPFS_GATEWAY_PUBLIC
+        # For all other cases (production, public testing), use the fastest
+        # healthy gateway from IPFS_GATEWAYS (defaults to IPFS_GATEWAY_PUBLIC)
+        base_url = gateway_pool.best()
         
     # Ensure the base URL ends with a slash before appending the CID
     gateway = base_url.rstrip('/') + '/'
@@ -46,22 +58,99 @@ async def upload_to_ipfs(file_data: bytes, filename: str) -> str | None:
 
     try:
         # Use httpx to post the file content (multipart/form-data)
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            files = {'file': (filename, file_data, 'application/octet-stream')}
-            response = await client.post(
-                IPFS_UPLOAD_URL,
-                files=files
-                # Add headers for authentication if using a service like Pinata
-            )
-            response.raise_for_status() # Raise exception for 4xx/5xx status codes
-            
-            # The response body should contain the CID (e.g., {"Hash": "..."})
-            result = response.json()
-            return result.get("Hash") # Return the CID/Hash
+        files = {'file': (filename, file_data, 'application/octet-stream')}
+        response = await get_client("ipfs").post(
+            IPFS_UPLOAD_URL,
+            files=files
+            # Add headers for authentication if using a service like Pinata
+        )
+        response.raise_for_status() # Raise exception for 4xx/5xx status codes
+
+        # The response body should contain the CID (e.g., {"Hash": "..."})
+        result = response.json()
+        return result.get("Hash") # Return the CID/Hash
 
     except httpx.HTTPStatusError as e:
         print(f"IPFS upload failed with status {e.response.status_code}: {e.response.text}")
         return None
     except Exception as e:
         print(f"An unexpected error occurred during IPFS upload: {e}")
-        return None
\ No newline at end of file
+        return None
+
+# --- Streaming uploads ---
+# Stage photos and lab PDFs are piped from the spooled upload to the IPFS
+# service chunk by chunk, so a request never holds the whole file in memory.
+IPFS_UPLOAD_MAX_BYTES = int(os.getenv("IPFS_UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+IPFS_UPLOAD_CHUNK_SIZE = int(os.getenv("IPFS_UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds IPFS_UPLOAD_MAX_BYTES (mapped to HTTP 413)."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the {round(limit / (1024 * 1024), 1)} MB limit")
+        self.limit = limit
+
+
+async def _multipart_stream(source, filename: str, content_type: str, boundary: str, max_bytes: int):
+    """Yields a multipart/form-data body, reading `source` in chunks."""
+    safe_name = (filename or "upload").replace('"', "").replace("\r", "").replace("\n", "")
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{safe_name}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+
+    total = 0
+    while True:
+        chunk = await source.read(IPFS_UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        yield chunk
+
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+async def upload_stream_to_ipfs(
+    source,
+    filename: str,
+    content_type: str = "application/octet-stream",
+    max_bytes: int | None = None,
+) -> str | None:
+    """
+    Streams `source` (anything with an async `read(n)`, e.g. an UploadFile)
+    to the IPFS upload service and returns the CID.
+    Raises UploadTooLarge once more than `max_bytes` have been read.
+    """
+    IPFS_UPLOAD_URL = os.getenv("IPFS_UPLOAD_URL")
+    if not IPFS_UPLOAD_URL:
+        print("CRITICAL: IPFS_UPLOAD_URL is not set in environment variables.")
+        return None
+
+    max_bytes = max_bytes or IPFS_UPLOAD_MAX_BYTES
+    # Reject early when the size is already known (UploadFile.size)
+    known_size = getattr(source, "size", None)
+    if known_size is not None and known_size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    boundary = uuid.uuid4().hex
+    try:
+        response = await get_client("ipfs").post(
+            IPFS_UPLOAD_URL,
+            content=_multipart_stream(source, filename, content_type, boundary, max_bytes),
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+        response.raise_for_status()
+        return response.json().get("Hash")
+
+    except UploadTooLarge:
+        raise
+    except httpx.HTTPStatusError as e:
+        print(f"IPFS upload failed with status {e.response.status_code}: {e.response.text}")
+        return None
+    except Exception as e:
+        print(f"An unexpected error occurred during IPFS upload: {e}")
+        return None
@@ -0,0 +1,130 @@
+# backend/app/jobs.py
+#
+# Small helpers for Mongo-backed job queues (outboxes).
+# A job document carries: status ("pending" | "in_flight" | "done" | "failed"),
+# attempts, next_attempt_at, lease_until and last_error. Workers claim jobs
+# atomically, so several API processes can drain the same queue safely.
+
+import random
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+
+
+def new_job(**fields) -> dict:
+    """Builds a pending job document ready to be inserted."""
+    now = datetime.utcnow()
+    return {
+        **fields,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "lease_until": None,
+        "last_error": None,
+        "createdAt": now,
+        "updatedAt": now,
+    }
+
+
+def backoff_delay(attempts: int, base: float, cap: float) -> float:
+    """Exponential backoff with jitter: base * 2^(attempts-1), capped."""
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def claim_next(col, lease_seconds: float, query: dict | None = None) -> dict | None:
+    """
+    Atomically claims the next due job. Jobs whose lease expired (worker
+    crashed mid-flight) are picked up again.
+    """
+    now = datetime.utcnow()
+    due = {
+        "$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "in_flight", "lease_until": {"$lte": now}},
+        ]
+    }
+    if query:
+        due = {"$and": [due, query]}
+
+    return await col.find_one_and_update(
+        due,
+        {
+            "$set": {
+                "status": "in_flight",
+                "lease_until": now + timedelta(seconds=lease_seconds),
+                "updatedAt": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("next_attempt_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def mark_done(col, job: dict, **fields):
+    await col.update_one(
+        {"_id": job["_id"]},
+        {"$set": {
+            **fields,
+            "status": "done",
+            "lease_until": None,
+            "last_error": None,
+            "updatedAt": datetime.utcnow(),
+        }}
+    )
+
+
+async def mark_failed(col, job: dict, error: str, max_attempts: int, base: float, cap: float) -> bool:
+    """
+    Records a failed attempt. Reschedules with backoff, or parks the job as
+    "failed" once max_attempts is reached. Returns True if the job is parked.
+    """
+    now = datetime.utcnow()
+    exhausted = job.get("attempts", 0) >= max_attempts
+    update = {
+        "status": "failed" if exhausted else "pending",
+        "lease_until": None,
+        "last_error": error,
+        "updatedAt": now,
+    }
+    if not exhausted:
+        update["next_attempt_at"] = now + timedelta(seconds=backoff_delay(job.get("attempts", 1), base, cap))
+
+    await col.update_one({"_id": job["_id"]}, {"$set": update})
+    return exhausted
+
+
+async def defer(col, job: dict, seconds: float, reason: str):
+    """
+    Puts a claimed job back without spending an attempt, e.g. while the
+    upstream's circuit breaker is open.
+    """
+    now = datetime.utcnow()
+    await col.update_one(
+        {"_id": job["_id"]},
+        {
+            "$set": {
+                "status": "pending",
+                "lease_until": None,
+                "last_error": reason,
+                "next_attempt_at": now + timedelta(seconds=seconds),
+                "updatedAt": now,
+            },
+            "$inc": {"attempts": -1},
+        }
+    )
+
+
+async def reset_failed(col, job_id) -> dict | None:
+    """Puts a parked job back in the queue with a fresh attempt budget."""
+    now = datetime.utcnow()
+    return await col.find_one_and_update(
+        {"_id": job_id, "status": "failed"},
+        {"$set": {
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "updatedAt": now,
+        }},
+        return_document=ReturnDocument.AFTER,
+    )
@@ -1,37 +1,75 @@
-import json, os, httpx, uuid
+import json, os, uuid, asyncio, math
 from fastapi import FastAPI, Depends, UploadFile, File, Form, Request, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pydantic import BaseModel
 from ml.inference import predict_species
 from utils.jwt import verify_token
 from utils.notify import notify
-from app.database import notification_collection, notification_helper, batches_col, batch_helper
-from app.ipfs_handler import upload_to_ipfs
+from app.database import notification_collection, notification_helper, batches_col, batch_helper, ensure_indexes
+from app.ipfs_handler import UploadTooLarge
+from app.rate_limit import RateLimitMiddleware
+from app import media_spool
+from app import http_clients, anchor_outbox, media_cache, gateway_pool, public_scan, role_directory, actor_stats, geo, geocode_cache
 # ROUTERS
 from routes.auth import router as auth_router
 from routes.batches import router as batch_router
 from routes.public import router as public_router
 from routes.admin import router as admin_router
-from .blockchain_client import create_batch 
+from routes.metrics import router as metrics_router
+from routes.media import router as media_router
 from bson import ObjectId
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pooled upstream HTTP clients (Fabric bridge, Polygon verifier, IPFS, Nominatim)
+    await http_clients.startup()
+    await ensure_indexes()
+    await asyncio.to_thread(media_cache.load)
+    # Users by role for notification fan-out and admin listings
+    await role_directory.load()
+    role_directory.start()
+    # Background worker draining the Fabric anchoring outbox
+    anchor_outbox.start()
+    # Background worker uploading spooled media to IPFS
+    media_spool.start()
+    # Health / latency probes across IPFS_GATEWAYS
+    gateway_pool.start()
+    yield
+    await gateway_pool.stop()
+    await media_spool.stop()
+    await anchor_outbox.stop()
+    await role_directory.stop()
+    await http_clients.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # ================= CORS =================
+# Added before CORS so CORS stays outermost and 429s carry its headers
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Readable by the cross-origin frontend: listing cursors, revalidation, backoff
+    expose_headers=["X-Next-Cursor", "ETag", "Retry-After"],
 )
 
+@app.exception_handler(UploadTooLarge)
+async def upload_too_large_handler(request: Request, exc: UploadTooLarge):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
 # ================= ROUTERS =================
 app.include_router(auth_router, prefix="/api") 
 app.include_router(batch_router, prefix="/api") 
 app.include_router(public_router, prefix="/api")
 app.include_router(admin_router, prefix="/api")
+app.include_router(metrics_router, prefix="/api")
+app.include_router(media_router, prefix="/api")
 # ================= CONFIG =================
 
 # ================= MODELS =================
@@ -108,6 +146,7 @@ async def create_batch_endpoint(data: BatchCreate, user=Depends(verify_token)):
         "farmer_id": data.farmId,
         "farmer_name": "Unknown",
         "location": data.coords,
+        "geo": geo.parse_coords(data.coords),  # GeoJSON Point for proximity queries
         "status": "planting",
         "timeline": {"planting": data.startDate},
         "createdAt": datetime.utcnow(),
@@ -118,9 +157,11 @@ async def create_batch_endpoint(data: BatchCreate, user=Depends(verify_token)):
     }
 
     await batches_col.insert_one(batch)
+    # The creating collector owns the batch, same as an admin assignment
+    await actor_stats.collector_assigned(user["id"])
 
-    # --- Initial Fabric Anchor: Basic Facts Only ---
-    await create_batch({
+    # --- Initial Fabric Anchor: Basic Facts Only (queued, see app/anchor_outbox.py) ---
+    await anchor_outbox.enqueue_anchor(batch_id, anchor_outbox.CREATION, {
         "batchId": batch_id,
         "farmerId": data.farmId,
         "collectorId": user["id"],
@@ -185,13 +226,17 @@ async def collector_update_stage(
     if not batch or batch["collector_data"]["id"] != user["id"]:
         raise HTTPException(403)
 
-    cid = await upload_to_ipfs(await photo.read(), photo.filename)
+    # Spooled locally; the IPFS upload happens in the background (app/media_spool.py)
+    media = await media_spool.spool_upload(photo, photo.filename, photo.content_type or "application/octet-stream")
 
     await batches_col.update_one(
         {"batch_id": batch_id},
         {"$set": {
             f"growth_data.stage_{stage}": {
-                "cid": cid,
+                "cid": media.cid,
+                "media_status": media.status,
+                "media_job_id": media.job_id,
+                "derivatives": media.derivatives,
                 "notes": notes,
                 "updated_at": datetime.utcnow()
             },
@@ -199,7 +244,16 @@ async def collector_update_stage(
             "status": f"growing_stage_{stage}"
         }}
     )
-    return {"message": f"Stage {stage} updated"}
+    await media.enqueue(
+        batch_id,
+        f"growth_data.stage_{stage}.cid",
+        f"growth_data.stage_{stage}.media_status",
+        f"growth_data.stage_{stage}.media_job_id",
+        derivatives_field=f"growth_data.stage_{stage}.derivatives",
+    )
+    if stage == 5 and not batch.get("growth_data", {}).get("stage_5"):
+        await actor_stats.collection_completed(user["id"], batch.get("timeline", {}).get("collection_assigned"))
+    return {"message": f"Stage {stage} updated", "media_status": media.status}
 
 @app.post("/api/collector/verify-leaf")
 async def verify_leaf(
@@ -334,6 +388,7 @@ async def get_stage_data(batch_id: str, stage: int, user=Depends(verify_token)):
         "photos": [stage_data.get("cid")] if stage_data.get("cid") else [],
         "notes": stage_data.get("notes", ""),
         "timestamp": stage_data.get("updated_at"),
+        "media_status": stage_data.get("media_status"),
         "status": "submitted" if stage_data else "pending",
         "submitted": bool(stage_data)  # \u2705 CRITICAL: Boolean flag for frontend
     }
@@ -366,6 +421,7 @@ async def accept_lab_task(batch_id: str = Body(...), user=Depends(verify_token))
 
     if result.modified_count == 0:
         raise HTTPException(409, "Batch already accepted")
+    await actor_stats.test_accepted(user["id"])
     await notification_collection.update_many(
     {"batch_id": batch_id, "role": "Tester"},
     {"$set": {"read": True}}
@@ -392,13 +448,16 @@ async def submit_lab(
         raise HTTPException(403)
 
     result = json.loads(result_json)
-    cid = await upload_to_ipfs(await report.read(), report.filename) if report else None
+    media = await media_spool.spool_upload(report, report.filename, report.content_type or "application/octet-stream") if report else None
 
-    await batches_col.update_one(
+    # Previous state: tells a first submission from a resubmission for the stats
+    batch = await batches_col.find_one_and_update(
     {"batch_id": batch_id},
     {"$set": {
         "lab_data.results": result,
-        "lab_data.report_cid": cid,
+        "lab_data.report_cid": media.cid if media else None,
+        "lab_data.report_status": media.status if media else None,
+        "lab_data.report_job_id": media.job_id if media else None,
 
         # ✅ ADD THESE 3 LINES
         "lab_data.tester_id": user["id"],
@@ -408,6 +467,19 @@ async def submit_lab(
         "status": "bidding_open" if result.get("passed") else "rejected"
     }}
 )
+    if not batch:
+        if media:
+            media.discard()
+        raise HTTPException(404, "Batch not found")
+    if not batch.get("lab_data", {}).get("submitted_at"):
+        await actor_stats.test_submitted(
+            user["id"],
+            batch.get("lab_data", {}).get("accepted_at"),
+            batch.get("collector_data", {}).get("id"),
+            bool(result.get("passed")),
+        )
+    if media:
+        await media.enqueue(batch_id, "lab_data.report_cid", "lab_data.report_status", "lab_data.report_job_id")
 
 
     if result.get("passed"):
@@ -422,7 +494,6 @@ async def submit_lab(
 
 
     # Notify Farmer
-    batch = await batches_col.find_one({"batch_id": batch_id})
     await notify(
         user_id=batch["farmer_id"],
         role="Farmer",
@@ -490,15 +561,11 @@ async def mark_notification_read(notification_id: str, user=Depends(verify_token
 
 @app.post("/api/utils/reverse-geocode")
 async def reverse_geocode(lat: float = Body(...), lon: float = Body(...)):
-    """Server-side reverse geocoding to avoid client rate limits"""
+    """Server-side reverse geocoding to avoid client rate limits (cached, see app/geocode_cache.py)"""
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            res = await client.get(
-                "https://nominatim.openstreetmap.org/reverse",
-                params={"lat": lat, "lon": lon, "format": "json"},
-                headers={"User-Agent": "VirtuHerbChain/1.0"}
-            )
-            return res.json()
+        return await geocode_cache.reverse(lat, lon)
+    except geocode_cache.GeocodeBusy as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
     except Exception as e:
         raise HTTPException(500, f"Geocoding failed: {str(e)}")
 
@@ -529,38 +596,33 @@ async def anchor_batch(batch_id: str = Body(...), user=Depends(verify_token)):
     
     if batch.get("blockchain_tx"):
         raise HTTPException(400, "Batch already anchored")
+
+    final_anchor = batch.get("anchors", {}).get(anchor_outbox.FINAL)
+    if final_anchor and final_anchor.get("status") != "failed":
+        raise HTTPException(400, "Batch anchoring already in progress")
     
     # --- Final Fabric Anchor: Use Available Verification Data ---
     final_grade = "PASSED" if is_lab_passed else "FAILED"
     
-    try:
-        anchor_response = await create_batch({
-            "batchId": batch_id,
-            "farmerId": batch["farmer_id"],
-            "collectorId": user["id"],
-            "herbName": batch["herb_name"].upper(),
-            "geo1": batch["location"],
-            "grade": final_grade,
-            "speciesScore": 100 if is_ml_verified else 0, 
-            "geoScore": 100, 
-        })
-        
-        tx_hash = anchor_response.get("txHash")
-        if not tx_hash:
-            raise Exception("Fabric bridge did not return a transaction hash.")
-        
-        await batches_col.update_one(
-            {"batch_id": batch_id},
-            {"$set": {
-                "blockchain_tx": tx_hash,
-                "status": "blockchain_anchored",
-                "anchored_at": datetime.utcnow()
-            }}
-        )
-        
-        return {"tx_hash": tx_hash, "message": "Batch anchored to blockchain"}
-    except Exception as e:
-        raise HTTPException(500, f"Blockchain anchoring failed: {str(e)}")
+    # The outbox worker writes blockchain_tx once the bridge confirms, and the
+    # status only if the batch has not moved past `advance_from` by then
+    job_id = await anchor_outbox.enqueue_anchor(batch_id, anchor_outbox.FINAL, {
+        "batchId": batch_id,
+        "farmerId": batch["farmer_id"],
+        "collectorId": user["id"],
+        "herbName": batch["herb_name"].upper(),
+        "geo1": batch["location"],
+        "grade": final_grade,
+        "speciesScore": 100 if is_ml_verified else 0, 
+        "geoScore": 100, 
+    }, advance_from=batch.get("status"))
+
+    return {
+        "tx_hash": None,
+        "anchor_status": "pending",
+        "job_id": job_id,
+        "message": "Batch queued for blockchain anchoring"
+    }
 @app.post("/api/manufacturer/submit-quote")
 async def submit_quote(
     batch_id: str = Body(...),
@@ -663,20 +725,25 @@ async def complete_packaging(
         "manufacturerId": user["id"],
         "timestamp": datetime.utcnow().isoformat(),
     }
-    anchor_response = await create_batch(fabric_anchor_payload)
-    final_tx_hash = anchor_response.get("txHash") 
+    packaging_fields = {
+        "packaged_at": datetime.utcnow(),
+        "status": "packaged",
+        "packaging_data": { 
+            "unit_id": product_unit_id,
+            "fabric_final_tx": None,  # filled in by the anchor outbox worker
+        }
+    }
     await batches_col.update_one(
         {"batch_id": batch_id},
-        {"$set": {
-            "packaged_at": datetime.utcnow(),
-            "status": "packaged",
-            "packaging_data": { 
-                "unit_id": product_unit_id,
-                "fabric_final_tx": final_tx_hash,
-            }
-        }}
+        {"$set": packaging_fields}
     )
-    return {"message": "Packaging completed and anchored", "product_unit_id": product_unit_id}
+    await anchor_outbox.enqueue_anchor(batch_id, anchor_outbox.PACKAGING, fabric_anchor_payload)
+
+    # The journey is final now: store the public scan payload once
+    batch.update(packaging_fields)
+    batch.setdefault("anchors", {})[anchor_outbox.PACKAGING] = {"status": "pending"}
+    await public_scan.materialize(batch)
+    return {"message": "Packaging completed, anchoring queued", "product_unit_id": product_unit_id}
 async def manufacturer_batches(user=Depends(verify_token)):
     if user["role"] != "Manufacturer":
         raise HTTPException(403)
@@ -713,13 +780,16 @@ async def farmer_submit_stage_proof(
     if not batch or batch["farmer_id"] != user["id"]:
         raise HTTPException(403, "Not your batch")
         
-    cid = await upload_to_ipfs(await photo.read(), photo.filename)
+    media = await media_spool.spool_upload(photo, photo.filename, photo.content_type or "application/octet-stream")
 
     await batches_col.update_one(
         {"batch_id": batch_id},
         {"$set": {
             f"farmer_updates.stage_{stage}": {
-                "cid": cid,
+                "cid": media.cid,
+                "media_status": media.status,
+                "media_job_id": media.job_id,
+                "derivatives": media.derivatives,
                 "notes": notes,
                 "updated_at": datetime.utcnow(),
                 "submitted_by": user["id"]
@@ -727,6 +797,13 @@ async def farmer_submit_stage_proof(
             "status": f"farmer_stage_{stage}_submitted" 
         }}
     )
+    await media.enqueue(
+        batch_id,
+        f"farmer_updates.stage_{stage}.cid",
+        f"farmer_updates.stage_{stage}.media_status",
+        f"farmer_updates.stage_{stage}.media_job_id",
+        derivatives_field=f"farmer_updates.stage_{stage}.derivatives",
+    )
     
     collector_id = batch.get("collector_data", {}).get("id")
     if collector_id:
@@ -739,4 +816,4 @@ async def farmer_submit_stage_proof(
             category="review"
         )
     
-    return {"message": f"Stage {stage} proof submitted to IPFS and pending Collector review."}
\ No newline at end of file
+    return {"message": f"Stage {stage} proof received and pending Collector review.", "media_status": media.status}
\ No newline at end of file
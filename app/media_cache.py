@@ -0,0 +1,209 @@
+# backend/app/media_cache.py
+#
+# Bounded on-disk LRU cache for IPFS content served by /api/media/{cid}.
+# CIDs are content addresses, so a cached object never goes stale; the only
+# policy needed is eviction once MEDIA_CACHE_MAX_BYTES is exceeded.
+#
+# Layout: <MEDIA_CACHE_DIR>/<cid> holds the bytes, <cid>.json the metadata
+# ({"size", "content_type"}). The LRU order lives in memory and is rebuilt
+# from file access times on startup.
+
+import os
+import re
+import json
+import uuid
+import asyncio
+from collections import OrderedDict
+
+from app.gateway_pool import open_hedged, GatewayError
+from app import metrics
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "./media_cache")
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+MEDIA_CACHE_MAX_OBJECT_BYTES = int(os.getenv("MEDIA_CACHE_MAX_OBJECT_BYTES", str(50 * 1024 ** 2)))
+MEDIA_CACHE_CHUNK_SIZE = int(os.getenv("MEDIA_CACHE_CHUNK_SIZE", str(64 * 1024)))
+
+_CID_PATTERN = re.compile(r"^[A-Za-z0-9]{10,128}$")
+
+# cid -> {"size", "content_type"}, least recently used first
+_index: OrderedDict[str, dict] = OrderedDict()
+_total_bytes = 0
+_fills: dict[str, asyncio.Task] = {}
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes_served_from_cache": 0}
+
+
+def is_valid_cid(cid: str) -> bool:
+    return bool(_CID_PATTERN.match(cid or ""))
+
+
+def _data_path(cid: str) -> str:
+    return os.path.join(MEDIA_CACHE_DIR, cid)
+
+
+def _meta_path(cid: str) -> str:
+    return os.path.join(MEDIA_CACHE_DIR, f"{cid}.json")
+
+
+def load():
+    """Rebuilds the in-memory index from disk, oldest access first."""
+    global _total_bytes
+    os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
+    entries = []
+    for name in os.listdir(MEDIA_CACHE_DIR):
+        if ".part-" in name:
+            # Leftover of a download interrupted by a restart
+            os.remove(os.path.join(MEDIA_CACHE_DIR, name))
+            continue
+        if name.endswith(".json"):
+            continue
+        try:
+            with open(_meta_path(name)) as f:
+                meta = json.load(f)
+            entries.append((os.stat(_data_path(name)).st_atime, name, meta))
+        except (OSError, ValueError):
+            continue
+
+    _index.clear()
+    _total_bytes = 0
+    for _, cid, meta in sorted(entries):
+        _index[cid] = meta
+        _total_bytes += meta["size"]
+
+
+def lookup(cid: str) -> dict | None:
+    """Returns {"path", "size", "content_type"} for a cached CID."""
+    meta = _index.get(cid)
+    if meta is None:
+        _stats["misses"] += 1
+        return None
+    _index.move_to_end(cid)
+    _stats["hits"] += 1
+    return {"path": _data_path(cid), **meta}
+
+
+def _commit(cid: str, tmp_path: str, size: int, content_type: str):
+    global _total_bytes
+    with open(_meta_path(cid), "w") as f:
+        json.dump({"size": size, "content_type": content_type}, f)
+    os.replace(tmp_path, _data_path(cid))
+    if cid not in _index:
+        _total_bytes += size
+    _index[cid] = {"size": size, "content_type": content_type}
+    _index.move_to_end(cid)
+    _evict()
+
+
+def _evict():
+    global _total_bytes
+    while _total_bytes > MEDIA_CACHE_MAX_BYTES and _index:
+        cid, meta = _index.popitem(last=False)
+        _total_bytes -= meta["size"]
+        _stats["evictions"] += 1
+        for path in (_data_path(cid), _meta_path(cid)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+async def open_upstream(cid: str, byte_range: str | None = None):
+    """
+    Starts a streamed GET for `cid` on the fastest gateway (hedged, see
+    app/gateway_pool.py); caller must aclose(). Raises GatewayError.
+    """
+    return await open_hedged(cid, byte_range)
+
+
+def _declared_size(response) -> int | None:
+    length = response.headers.get("content-length")
+    if not length or response.headers.get("content-encoding", "identity") != "identity":
+        return None
+    try:
+        return int(length)
+    except ValueError:
+        return None
+
+
+async def stream_and_cache(cid: str, response):
+    """
+    Yields the upstream body while writing it to a temporary file; the file
+    joins the cache only if the whole body arrived and fits the object cap.
+    """
+    os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{_data_path(cid)}.part-{uuid.uuid4().hex}"
+    content_type = response.headers.get("content-type", "application/octet-stream")
+    fh = await asyncio.to_thread(open, tmp_path, "wb")
+    size = 0
+    complete = False
+    try:
+        async for chunk in response.aiter_bytes(MEDIA_CACHE_CHUNK_SIZE):
+            size += len(chunk)
+            if size <= MEDIA_CACHE_MAX_OBJECT_BYTES:
+                await asyncio.to_thread(fh.write, chunk)
+            yield chunk
+        complete = True
+    finally:
+        await response.aclose()
+        fh.close()
+        if complete and size <= MEDIA_CACHE_MAX_OBJECT_BYTES:
+            _commit(cid, tmp_path, size, content_type)
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def relay(response):
+    """Yields an upstream body that is not cached (e.g. a ranged response)."""
+    try:
+        async for chunk in response.aiter_bytes(MEDIA_CACHE_CHUNK_SIZE):
+            yield chunk
+    finally:
+        await response.aclose()
+
+
+async def _fill(cid: str) -> dict | None:
+    response = await open_upstream(cid)
+    size = _declared_size(response)
+    if size is not None and size > MEDIA_CACHE_MAX_OBJECT_BYTES:
+        # Never cacheable: don't download it just to throw it away
+        await response.aclose()
+        return None
+    async for _ in stream_and_cache(cid, response):
+        pass
+    return lookup(cid)
+
+
+async def fill(cid: str) -> dict | None:
+    """
+    Downloads `cid` fully into the cache (concurrent callers share one
+    download) and returns its entry, or None if it is too large to cache.
+    """
+    task = _fills.get(cid)
+    if task is None:
+        task = asyncio.create_task(_fill(cid))
+        _fills[cid] = task
+        task.add_done_callback(lambda _: _fills.pop(cid, None))
+    return await asyncio.shield(task)
+
+
+async def iter_file(path: str, start: int, end: int):
+    """Yields bytes start..end (inclusive) of a cached file."""
+    fh = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(fh.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(fh.read, min(MEDIA_CACHE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            _stats["bytes_served_from_cache"] += len(chunk)
+            yield chunk
+    finally:
+        fh.close()
+
+
+def stats() -> dict:
+    return {**_stats, "entries": len(_index), "bytes": _total_bytes, "max_bytes": MEDIA_CACHE_MAX_BYTES}
+
+
+metrics.register("media_cache", stats)
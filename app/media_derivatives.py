@@ -0,0 +1,51 @@
+# backend/app/media_derivatives.py
+#
+# Web-optimised derivatives for stage photos. Full-resolution originals stay
+# on IPFS as uploaded; the public scan links these smaller renditions.
+# make_derivatives() is CPU-bound - call it through asyncio.to_thread.
+
+import os
+from io import BytesIO
+from PIL import Image, ImageOps, features
+
+# name -> longest edge in pixels
+DERIVATIVE_SIZES = {
+    "thumb": int(os.getenv("MEDIA_THUMB_SIZE", "320")),
+    "display": int(os.getenv("MEDIA_DISPLAY_SIZE", "1280")),
+}
+DERIVATIVE_QUALITY = int(os.getenv("MEDIA_DERIVATIVE_QUALITY", "80"))
+
+# Guard against decompression bombs in user uploads
+Image.MAX_IMAGE_PIXELS = int(os.getenv("MEDIA_MAX_IMAGE_PIXELS", str(80_000_000)))
+
+_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+CONTENT_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+
+def make_derivatives(path: str) -> dict[str, dict]:
+    """
+    Renders every DERIVATIVE_SIZES rendition of the image at `path`.
+    Returns {name: {"data", "width", "height", "format", "content_type"}}.
+    Raises PIL errors for files that are not decodable images.
+    """
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        if _FORMAT == "JPEG" and image.mode == "RGBA":
+            image = image.convert("RGB")
+
+        renditions = {}
+        for name, edge in DERIVATIVE_SIZES.items():
+            copy = image.copy()
+            copy.thumbnail((edge, edge), Image.LANCZOS)  # never upscales
+            buffer = BytesIO()
+            copy.save(buffer, format=_FORMAT, quality=DERIVATIVE_QUALITY, optimize=True)
+            renditions[name] = {
+                "data": buffer.getvalue(),
+                "width": copy.width,
+                "height": copy.height,
+                "format": _FORMAT.lower(),
+                "content_type": CONTENT_TYPES[_FORMAT],
+            }
+        return renditions
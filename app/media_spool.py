@@ -0,0 +1,314 @@
+# backend/app/media_spool.py
+#
+# Write-behind spool for stage photos and lab reports.
+# A request copies the upload to MEDIA_SPOOL_DIR (hashing it on the way),
+# records the media on the batch as "pending" and returns immediately. A
+# background worker uploads spooled files to IPFS with retries and patches
+# the real CID into the batch (growth_data / farmer_updates / lab_data).
+#
+# Content already known to the dedup index (app/media_store.py) resolves to
+# its CID straight away and never touches the spool.
+#
+# Photos also get thumbnail / display derivatives (app/media_derivatives.py),
+# rendered in a worker thread after the original is stored.
+#
+# Each batch field records the job that owns it (`media_job_id` next to a
+# stage CID, `lab_data.report_job_id` for lab reports). The worker only
+# patches fields its job still owns, so a resubmission made while an older
+# upload is pending is never overwritten when the older job finishes.
+#
+# Spool files are local, so a job is only claimed by the host that spooled
+# it (MEDIA_SPOOL_HOST). With MEDIA_SPOOL_DIR on shared storage, give every
+# instance the same MEDIA_SPOOL_HOST.
+
+import os
+import socket
+import hashlib
+import asyncio
+from io import BytesIO
+from datetime import datetime
+from bson import ObjectId
+
+from app.database import media_jobs_col, batches_col
+from app.ipfs_handler import upload_stream_to_ipfs, UploadTooLarge, IPFS_UPLOAD_CHUNK_SIZE, IPFS_UPLOAD_MAX_BYTES
+from app.media_store import lookup_content, remember_cid, remember_derivatives
+from app.media_derivatives import make_derivatives
+from app import jobs, metrics, public_scan
+
+MEDIA_SPOOL_DIR = os.getenv("MEDIA_SPOOL_DIR", "./media_spool")
+MEDIA_SPOOL_HOST = os.getenv("MEDIA_SPOOL_HOST", socket.gethostname())
+MEDIA_MAX_ATTEMPTS = int(os.getenv("MEDIA_MAX_ATTEMPTS", "10"))
+MEDIA_BACKOFF_BASE = float(os.getenv("MEDIA_BACKOFF_BASE", "5"))
+MEDIA_BACKOFF_CAP = float(os.getenv("MEDIA_BACKOFF_CAP", "600"))
+MEDIA_LEASE_SECONDS = float(os.getenv("MEDIA_LEASE_SECONDS", "120"))
+MEDIA_POLL_INTERVAL = float(os.getenv("MEDIA_POLL_INTERVAL", "5"))
+
+# Media status values stored next to each CID field on the batch
+PENDING = "pending"
+STORED = "stored"
+FAILED = "failed"
+
+_wakeup = asyncio.Event()
+_worker_task: asyncio.Task | None = None
+
+
+class _SpoolFile:
+    """Async read(n) over a spooled file or in-memory buffer, for upload_stream_to_ipfs."""
+
+    def __init__(self, fh):
+        self.fh = fh
+
+    async def read(self, n: int) -> bytes:
+        return await asyncio.to_thread(self.fh.read, n)
+
+
+class SpooledMedia:
+    """
+    Result of spool_upload(). Write `cid` / `status` / `job_id` onto the
+    batch first, then call enqueue() so the worker can never race ahead of
+    the request's own update.
+    """
+
+    def __init__(self, cid, job_id, path, filename, content_type, sha256, size, derivatives=None):
+        self.cid = cid
+        self.derivatives = derivatives
+        self.job_id = job_id
+        self.path = path
+        self.filename = filename
+        self.content_type = content_type
+        self.sha256 = sha256
+        self.size = size
+
+    @property
+    def status(self) -> str:
+        return STORED if self.cid else PENDING
+
+    async def enqueue(
+        self, batch_id: str, cid_field: str, status_field: str, job_id_field: str,
+        derivatives_field: str | None = None,
+    ):
+        """
+        Queues the IPFS upload; no-op when the CID was already known.
+        `job_id_field` is the batch field holding this media's job_id; the
+        worker's writes are conditional on it. With `derivatives_field`,
+        image derivatives are rendered and stored there.
+        """
+        if self.cid:
+            return
+        await media_jobs_col.insert_one({
+            **jobs.new_job(
+                batch_id=batch_id,
+                cid_field=cid_field,
+                status_field=status_field,
+                job_id_field=job_id_field,
+                derivatives_field=derivatives_field,
+                spool_host=MEDIA_SPOOL_HOST,
+                spool_path=self.path,
+                filename=self.filename,
+                content_type=self.content_type,
+                sha256=self.sha256,
+                size=self.size,
+                cid=None,
+            ),
+            "_id": ObjectId(self.job_id),
+        })
+        _wakeup.set()
+
+    def discard(self):
+        """Drops the spooled file of media that will never be enqueued."""
+        _remove(self.path)
+
+
+async def spool_upload(upload, filename: str, content_type: str = "application/octet-stream") -> SpooledMedia:
+    """
+    Copies an UploadFile into the spool in chunks while hashing it.
+    Raises UploadTooLarge past IPFS_UPLOAD_MAX_BYTES.
+    """
+    os.makedirs(MEDIA_SPOOL_DIR, exist_ok=True)
+    job_id = str(ObjectId())
+    path = os.path.join(MEDIA_SPOOL_DIR, job_id)
+
+    digest = hashlib.sha256()
+    size = 0
+    await upload.seek(0)
+    fh = await asyncio.to_thread(open, path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(IPFS_UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > IPFS_UPLOAD_MAX_BYTES:
+                raise UploadTooLarge(IPFS_UPLOAD_MAX_BYTES)
+            digest.update(chunk)
+            await asyncio.to_thread(fh.write, chunk)
+    except BaseException:
+        fh.close()
+        _remove(path)
+        raise
+    fh.close()
+
+    sha256 = digest.hexdigest()
+    known = await lookup_content(sha256, size)
+    if known:
+        _remove(path)
+        return SpooledMedia(known["cid"], None, None, filename, content_type, sha256, size, known.get("derivatives"))
+    return SpooledMedia(None, job_id, path, filename, content_type, sha256, size)
+
+
+def _remove(path: str | None):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _owned_by(job: dict) -> dict:
+    """Batch filter matching only while the media field still belongs to this job."""
+    query = {"batch_id": job["batch_id"]}
+    if job.get("job_id_field"):
+        query[job["job_id_field"]] = str(job["_id"])
+    return query
+
+
+async def _record_failure(job: dict, error: str, permanent: bool = False):
+    if permanent:
+        await media_jobs_col.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": FAILED, "last_error": error, "lease_until": None, "updatedAt": datetime.utcnow()}}
+        )
+        parked = True
+    else:
+        parked = await jobs.mark_failed(
+            media_jobs_col, job, error,
+            MEDIA_MAX_ATTEMPTS, MEDIA_BACKOFF_BASE, MEDIA_BACKOFF_CAP,
+        )
+    if parked:
+        print(f"Media job {job['_id']} for {job['batch_id']} failed permanently: {error}")
+        await batches_col.update_one(_owned_by(job), {"$set": {job["status_field"]: FAILED}})
+
+
+async def process_job(job: dict):
+    """Uploads one spooled file and patches its CID into the batch."""
+    path = job["spool_path"]
+    if not os.path.exists(path):
+        await _record_failure(job, "Spooled file is missing", permanent=True)
+        return
+
+    fh = await asyncio.to_thread(open, path, "rb")
+    try:
+        cid = await upload_stream_to_ipfs(_SpoolFile(fh), job["filename"], job["content_type"])
+    finally:
+        fh.close()
+
+    if not cid:
+        await _record_failure(job, "IPFS upload failed")
+        return
+
+    await remember_cid(job["sha256"], job["size"], cid, job["filename"])
+    fields = {job["cid_field"]: cid, job["status_field"]: STORED}
+    if job.get("derivatives_field"):
+        derivatives = await _store_derivatives(path, job["filename"])
+        if derivatives:
+            fields[job["derivatives_field"]] = derivatives
+            await remember_derivatives(job["sha256"], derivatives)
+
+    # No match: the media was resubmitted meanwhile and the newer upload wins
+    result = await batches_col.update_one(_owned_by(job), {"$set": fields})
+    await jobs.mark_done(media_jobs_col, job, cid=cid, superseded=result.matched_count == 0)
+    _remove(path)
+    if result.matched_count:
+        # Packaged before the upload finished: the scan snapshot needs the CID
+        await public_scan.refresh(job["batch_id"])
+
+
+async def _store_derivatives(path: str, filename: str) -> dict | None:
+    """
+    Renders derivatives off the event loop and stores each on IPFS.
+    Returns {name: {"cid", "width", "height", "format"}}, or None when the
+    file is not a decodable image or any upload fails (the original stands).
+    """
+    try:
+        renditions = await asyncio.to_thread(make_derivatives, path)
+    except Exception as e:
+        print(f"Skipping derivatives for {filename}: {e}")
+        return None
+
+    stem = os.path.splitext(filename or "photo")[0]
+    derivatives = {}
+    for name, rendition in renditions.items():
+        data = rendition["data"]
+        sha256 = hashlib.sha256(data).hexdigest()
+        known = await lookup_content(sha256, len(data))
+        cid = known["cid"] if known else await upload_stream_to_ipfs(
+            _SpoolFile(BytesIO(data)), f"{stem}_{name}.{rendition['format']}", rendition["content_type"]
+        )
+        if not cid:
+            return None
+        if not known:
+            await remember_cid(sha256, len(data), cid, f"{stem}_{name}.{rendition['format']}")
+        derivatives[name] = {
+            "cid": cid,
+            "width": rendition["width"],
+            "height": rendition["height"],
+            "format": rendition["format"],
+        }
+    return derivatives
+
+
+async def retry_media(job_id: str) -> dict | None:
+    """Re-queues a failed media job whose spooled file still exists."""
+    if not ObjectId.is_valid(job_id):
+        return None
+    job = await jobs.reset_failed(media_jobs_col, ObjectId(job_id))
+    if not job:
+        return None
+    await batches_col.update_one(_owned_by(job), {"$set": {job["status_field"]: PENDING}})
+    await public_scan.refresh(job["batch_id"])
+    _wakeup.set()
+    return job
+
+
+async def run_worker():
+    """Drains due media jobs, then sleeps until woken or the poll interval."""
+    while True:
+        try:
+            # Jobs queued before spool_host existed have none; any host may try them
+            job = await jobs.claim_next(
+                media_jobs_col, MEDIA_LEASE_SECONDS, {"spool_host": {"$in": [MEDIA_SPOOL_HOST, None]}}
+            )
+            if job:
+                await process_job(job)
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Media worker error: {e}")
+
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=MEDIA_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start():
+    global _worker_task
+    if _worker_task is None or _worker_task.done():
+        _worker_task = asyncio.create_task(run_worker())
+
+
+async def stop():
+    global _worker_task
+    if _worker_task:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
+
+
+metrics.register("media_spool", lambda: {
+    "spool_dir": MEDIA_SPOOL_DIR,
+    "spool_host": MEDIA_SPOOL_HOST,
+    "spooled_files": len(os.listdir(MEDIA_SPOOL_DIR)) if os.path.isdir(MEDIA_SPOOL_DIR) else 0,
+})
@@ -0,0 +1,61 @@
+# backend/app/media_store.py
+#
+# Content-addressed dedup index for IPFS uploads.
+# Uploads are hashed (SHA-256) chunk by chunk while they are spooled (see
+# app/media_spool.py); the media_index collection maps content hashes to CIDs,
+# so re-submitted bytes (client retries, duplicate submissions) return the
+# known CID without another transfer to the IPFS service.
+
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+
+from app.database import media_index_col
+from app import metrics
+
+_stats = {"hits": 0, "misses": 0, "bytes_saved": 0, "bytes_uploaded": 0}
+
+
+async def lookup_content(sha256: str, size: int) -> dict | None:
+    """
+    Returns the index entry ({"cid", "derivatives", ...}) already known for
+    this content, counting the hit.
+    """
+    entry = await media_index_col.find_one_and_update(
+        {"_id": sha256},
+        {"$inc": {"hits": 1}, "$set": {"lastHitAt": datetime.utcnow()}},
+    )
+    if not entry:
+        _stats["misses"] += 1
+        return None
+    _stats["hits"] += 1
+    _stats["bytes_saved"] += size
+    return entry
+
+
+async def remember_cid(sha256: str, size: int, cid: str, filename: str):
+    _stats["bytes_uploaded"] += size
+    try:
+        await media_index_col.insert_one({
+            "_id": sha256,
+            "cid": cid,
+            "size": size,
+            "filename": filename,
+            "hits": 0,
+            "createdAt": datetime.utcnow(),
+        })
+    except DuplicateKeyError:
+        # Another request uploaded the same bytes concurrently
+        pass
+
+
+async def remember_derivatives(sha256: str, derivatives: dict):
+    """Attaches generated derivatives to an original, so dedup hits reuse them."""
+    await media_index_col.update_one({"_id": sha256}, {"$set": {"derivatives": derivatives}})
+
+
+def stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {**_stats, "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else 0.0}
+
+
+metrics.register("media_dedup", stats)
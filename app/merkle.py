@@ -0,0 +1,81 @@
+# backend/app/merkle.py
+#
+# Minimal SHA-256 Merkle tree used to batch many anchor payloads into a
+# single Fabric transaction. Leaves and inner nodes are domain-separated
+# (0x00 / 0x01 prefixes) so a leaf can never be passed off as an inner node.
+
+import json
+import hashlib
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def canonical(payload: dict) -> str:
+    """The exact text a leaf hash commits to; stored so the leaf can be recomputed."""
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def canonical_leaf_hash(text: str) -> str:
+    return _sha256(b"\x00" + text.encode())
+
+
+def leaf_hash(payload: dict) -> str:
+    """Hashes an anchor payload in canonical JSON form."""
+    return canonical_leaf_hash(canonical(payload))
+
+
+def _node_hash(left: str, right: str) -> str:
+    return _sha256(b"\x01" + bytes.fromhex(left) + bytes.fromhex(right))
+
+
+def build_tree(leaves: list[str]) -> tuple[str, list[list[dict]]]:
+    """
+    Builds a tree over the given leaf hashes.
+    Returns the root and, for every leaf, its inclusion proof: a list of
+    {"hash": sibling, "position": "left" | "right"} from leaf to root.
+    An unpaired node at the end of a level is promoted unchanged.
+    """
+    if not leaves:
+        raise ValueError("Cannot build a Merkle tree without leaves")
+
+    proofs: list[list[dict]] = [[] for _ in leaves]
+    # positions[i] = index of leaf i's ancestor in the current level
+    positions = list(range(len(leaves)))
+    level = list(leaves)
+
+    while len(level) > 1:
+        next_level = []
+        for i in range(0, len(level), 2):
+            if i + 1 < len(level):
+                next_level.append(_node_hash(level[i], level[i + 1]))
+            else:
+                next_level.append(level[i])
+
+        for leaf_index, pos in enumerate(positions):
+            sibling = pos ^ 1
+            if sibling < len(level):
+                proofs[leaf_index].append({
+                    "hash": level[sibling],
+                    "position": "left" if sibling < pos else "right",
+                })
+            positions[leaf_index] = pos // 2
+
+        level = next_level
+
+    return level[0], proofs
+
+
+def verify_proof(leaf: str, proof: list[dict], root: str) -> bool:
+    """Recomputes the root from a leaf and its inclusion proof."""
+    try:
+        current = leaf
+        for step in proof:
+            if step["position"] == "left":
+                current = _node_hash(step["hash"], current)
+            else:
+                current = _node_hash(current, step["hash"])
+        return current == root
+    except (KeyError, TypeError, ValueError):
+        return False
@@ -0,0 +1,23 @@
+# backend/app/metrics.py
+#
+# Tiny in-process metrics registry. Modules register a zero-argument
+# callable returning a JSON-serialisable snapshot; /api/metrics
+# (routes/metrics.py) collects them all on demand.
+
+from typing import Callable
+
+_providers: dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, provider: Callable[[], dict]):
+    _providers[name] = provider
+
+
+def snapshot() -> dict:
+    result = {}
+    for name, provider in _providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {"error": str(e)}
+    return result
@@ -8,6 +8,8 @@ class MediaItem(BaseModel):
     id: int
     title: str
     url: str = Field(description="The public IPFS gateway URL derived from the CID.")
+    thumbnailUrl: Optional[str] = Field(default=None, description="Small rendition for lists and previews.")
+    displayUrl: Optional[str] = Field(default=None, description="Screen-sized rendition; fall back to url when absent.")
     description: Optional[str] = None
     duration: Optional[str] = None 
 
@@ -20,6 +22,14 @@ class Stage(BaseModel):
     photos: List[MediaItem] = []
     audio: Optional[MediaItem] = None
 
+class AnchorProof(BaseModel):
+    kind: str
+    txHash: Optional[str] = None
+    root: str
+    leaf: str
+    proof: List[dict] = Field(default=[], description="Sibling hashes from leaf to root.")
+    verified: bool = Field(description="Proof rebuilds the root and the root is anchored under txHash.")
+
 class PublicBatchDetails(BaseModel):
     productName: str
     batchId: str
@@ -27,4 +37,8 @@ class PublicBatchDetails(BaseModel):
     farmerName: str
     farmLocation: str
     blockchainTxHash: Optional[str] = None
-    processingStages: List[Stage] = Field(description="Chronological list of all verifiable supply chain events.")
\ No newline at end of file
+    processingStages: List[Stage] = Field(description="Chronological list of all verifiable supply chain events.")
+    anchorProofs: List[AnchorProof] = Field(default=[], description="Merkle inclusion proofs for batched chain anchors.")
+
+class BulkScanRequest(BaseModel):
+    unitIds: List[str] = Field(min_items=1, max_items=1000, description="Product unit IDs from the QR codes.")
@@ -0,0 +1,66 @@
+# backend/app/pagination.py
+#
+# Keyset (cursor) pagination helpers for list endpoints.
+# Results are sorted by (field, _id); the cursor carries the last row's pair,
+# so the next page is one indexed range scan instead of skip/limit.
+
+import json
+import base64
+from datetime import datetime
+from bson import ObjectId
+from fastapi import HTTPException
+
+
+def encode_cursor(value, _id) -> str:
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    raw = json.dumps([value, str(_id)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Returns (value, _id); raises a 400 for cursors we did not issue."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, _id = json.loads(raw)
+        if isinstance(value, dict) and "$date" in value:
+            value = datetime.fromisoformat(value["$date"])
+        return value, (ObjectId(_id) if ObjectId.is_valid(_id) else _id)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+
+def keyset_filter(field: str, direction: int, cursor: str | None) -> dict:
+    """Query clause selecting rows strictly after the cursor in (field, _id) order."""
+    if not cursor:
+        return {}
+    value, _id = decode_cursor(cursor)
+    after = "$gt" if direction > 0 else "$lt"
+    if value is None:
+        # Missing values sort first ascending and last descending
+        if direction > 0:
+            return {"$or": [{field: None, "_id": {"$gt": _id}}, {field: {"$ne": None}}]}
+        return {field: None, "_id": {"$lt": _id}}
+    clauses = [{field: {after: value}}, {field: value, "_id": {after: _id}}]
+    if direction < 0:
+        clauses.append({field: None})
+    return {"$or": clauses}
+
+
+def parse_sort(sort: str, allowed: dict[str, str]) -> tuple[str, int]:
+    """'name' / '-name' -> (document field, direction) using an allow-list."""
+    direction = -1 if sort.startswith("-") else 1
+    key = sort.lstrip("-")
+    if key not in allowed:
+        raise HTTPException(400, f"sort must be one of: {', '.join(sorted(allowed))} (prefix '-' for descending)")
+    return allowed[key], direction
+
+
+def next_cursor(rows: list[dict], field: str, limit: int) -> str | None:
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    value = last
+    for part in field.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return encode_cursor(value, last["_id"])
@@ -0,0 +1,363 @@
+# backend/app/public_scan.py
+#
+# Builds the consumer scan payload (GET /api/public/scan/{id}) and keeps
+# immutable snapshots of it for packaged products.
+#
+# Once a batch is packaged its journey never changes, so complete_packaging
+# materializes the payload into `scan_snapshots` and scans are served from an
+# in-memory LRU over that collection. Only the badge (status / txHash, from
+# the verification cache) is computed per request. Anchor data that lands
+# after packaging (the outbox fills in fabric_final_tx and Merkle proofs) is
+# pulled into the snapshot in the background until every anchor is settled.
+#
+# Snapshots store media as CIDs; render() turns them into URLs per request,
+# so scans follow the current gateway choice (app/gateway_pool.py) and
+# MEDIA_PROXY_BASE_URL. Media uploads that finish after packaging call
+# refresh() to re-materialize the batch.
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import List
+
+from app.database import batches_col, scan_snapshots_col
+from app.ipfs_handler import get_public_url
+from app.models.public import Stage, MediaItem, AnchorProof
+from app.anchor_outbox import verify_merkle_anchors
+from app import metrics
+
+SCAN_SNAPSHOT_LRU_SIZE = int(os.getenv("SCAN_SNAPSHOT_LRU_SIZE", "5000"))
+SCAN_SNAPSHOT_LRU_TTL = float(os.getenv("SCAN_SNAPSHOT_LRU_TTL", "300"))
+SCAN_ANCHOR_RECHECK_SECONDS = float(os.getenv("SCAN_ANCHOR_RECHECK_SECONDS", "30"))
+
+# Bumped when the stored journey layout changes; older snapshots are rebuilt on scan
+SNAPSHOT_FORMAT = 2
+
+# Batch fields the scan payload reads; keeps the (large) raw document off the wire
+SCAN_PROJECTION = {
+    "batch_id": 1, "status": 1, "herb_name": 1, "farmer_name": 1, "location": 1,
+    "growth_data": 1, "collector_data.name": 1,
+    "lab_data.report_cid": 1, "lab_data.submitted_at": 1, "lab_data.results.passed": 1, "lab_data.tester_name": 1,
+    "manufacturer_data.name": 1, "manufacturing_data.submitted_at": 1,
+    "packaged_at": 1, "packaging_data": 1, "anchors": 1,
+}
+
+# scan id (unit_id or batch_id) -> (snapshot, expires_at), in LRU order
+_lru: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+_refreshing: dict[str, asyncio.Task] = {}
+_stats = {"lru_hits": 0, "store_hits": 0, "misses": 0, "materialized": 0, "anchor_refreshes": 0}
+
+
+def _format_date(dt: object) -> str:
+    """Safely formats a datetime object or returns N/A."""
+    return dt.strftime('%Y-%m-%d %H:%M') if isinstance(dt, datetime) else "N/A"
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
+async def find_batch(scan_id: str) -> dict | None:
+    """
+    Resolves a product unit ID or a batch ID in one read; both fields are
+    indexed (see ensure_indexes).
+    """
+    return await batches_col.find_one(
+        {"$or": [{"packaging_data.unit_id": scan_id}, {"batch_id": scan_id}]},
+        SCAN_PROJECTION,
+    )
+
+
+# ==============================
+# Payload builders
+# ==============================
+
+def _media(title: str, cid: str, description: str, thumbnail_cid: str | None = None, display_cid: str | None = None) -> dict:
+    """A photo as stored in journeys: CIDs only, resolved to URLs by resolve_media()."""
+    return {
+        "id": 1,
+        "title": title,
+        "cid": cid,
+        "thumbnailCid": thumbnail_cid,
+        "displayCid": display_cid,
+        "description": description,
+    }
+
+
+def _stage(stage: Stage, photos: list[dict]) -> dict:
+    return {**stage.dict(), "photos": photos}
+
+
+def resolve_media(journey: dict) -> dict:
+    """Copy of a journey with every photo's CIDs turned into current gateway URLs."""
+    url_template = get_public_url("{cid}")
+
+    def url(cid: str | None) -> str | None:
+        return url_template.replace("{cid}", cid) if cid else None
+
+    stages = []
+    for stage in journey["processingStages"]:
+        photos = [
+            MediaItem(
+                id=photo["id"],
+                title=photo["title"],
+                url=url(photo["cid"]),
+                thumbnailUrl=url(photo.get("thumbnailCid")),
+                displayUrl=url(photo.get("displayCid")),
+                description=photo.get("description"),
+            ).dict()
+            for photo in stage.get("photos", [])
+        ]
+        stages.append({**stage, "photos": photos})
+    return {**journey, "processingStages": stages}
+
+
+def build_journey(batch_doc: dict, product_unit_id: str) -> dict:
+    """
+    Everything in PublicBatchDetails that does not depend on chain state,
+    with media as CIDs (see resolve_media).
+    """
+    packaging_info = batch_doc.get('packaging_data', {})
+    stages_list: List[dict] = []
+    stage_counter = 1
+    collector_info = batch_doc.get('collector_data', {})
+
+    # 1. Growth Stages (Source: Collector's proof in growth_data)
+    for i in range(1, 6):
+        stage_key = f"stage_{i}"
+        stage_data = batch_doc.get('growth_data', {}).get(stage_key)
+
+        if stage_data and stage_data.get('cid'):
+            derivatives = stage_data.get('derivatives') or {}
+            photos = [_media(
+                title="Verification Photo",
+                cid=stage_data['cid'],
+                thumbnail_cid=derivatives.get('thumb', {}).get('cid'),
+                display_cid=derivatives.get('display', {}).get('cid'),
+                description=stage_data.get('notes', 'Collector verification proof.'),
+            )]
+
+            stages_list.append(_stage(Stage(
+                id=stage_counter,
+                name=f"Cultivation Stage {i} Verified",
+                date=_format_date(stage_data.get('updated_at')),
+                location=batch_doc.get('location', 'Farm Location'),
+                description=f"Stage {i} proof submitted by Collector {collector_info.get('name', 'N/A')}.",
+            ), photos))
+            stage_counter += 1
+
+    # 2. Lab Testing Stage (Source: lab_data)
+    lab_data = batch_doc.get('lab_data')
+    if lab_data and lab_data.get('report_cid') and lab_data.get('submitted_at'):
+        report_cid = lab_data['report_cid']
+
+        photos = [_media(
+            title="Official Lab Test Report",
+            cid=report_cid,
+            description=f"Purity Test Results: {'Passed' if lab_data.get('results', {}).get('passed') else 'Failed'}.",
+        )]
+
+        stages_list.append(_stage(Stage(
+            id=stage_counter,
+            name="Quality Testing & Lab Verification",
+            date=_format_date(lab_data.get('submitted_at')),
+            location=f"Lab Tester: {lab_data.get('tester_name', 'N/A')}",
+            description=f"Batch tested and confirmed {batch_doc.get('status').upper()} for purity.",
+        ), photos))
+        stage_counter += 1
+
+    # 3. Manufacturing & Packaging Stage
+    mfg_data = batch_doc.get('manufacturer_data')
+    mfg_submission = batch_doc.get('manufacturing_data', {})
+
+    if batch_doc.get('status') in ["manufacturing_done", "packaged"] and mfg_data:
+        mfg_date = batch_doc.get('packaged_at') or mfg_submission.get('submitted_at')
+
+        stages_list.append(_stage(Stage(
+            id=stage_counter,
+            name="Manufacturing & Final Packaging",
+            date=_format_date(mfg_date),
+            location=mfg_data.get('name', 'GMP Facility'),
+            description=f"Product packaged by {mfg_data.get('name')}. Final Product ID: {packaging_info.get('unit_id', product_unit_id)}.",
+        ), []))
+        stage_counter += 1
+
+    return {
+        "productName": batch_doc.get('herb_name', 'Herbal Product'),
+        "batchId": packaging_info.get('unit_id') or product_unit_id,
+        "farmerName": batch_doc.get('farmer_name', 'N/A'),
+        "farmLocation": batch_doc.get('location', 'N/A'),
+        "processingStages": stages_list,
+    }
+
+
+async def build_anchor_proofs(anchors: dict) -> list[dict]:
+    """Merkle-batched anchors with their inclusion proofs verified locally."""
+    proof_results = await verify_merkle_anchors(anchors)
+    return [
+        AnchorProof(
+            kind=kind,
+            txHash=anchors[kind].get('tx_hash'),
+            root=anchors[kind]['merkle']['root'],
+            leaf=anchors[kind]['merkle']['leaf'],
+            proof=anchors[kind]['merkle'].get('proof', []),
+            verified=verified,
+        ).dict()
+        for kind, verified in proof_results.items()
+    ]
+
+
+def build_badge(batch_status: str, verification: dict, fabric_tx: str | None) -> dict:
+    """Consumer-facing status and tx hash from the live public chain verification."""
+    final_status = batch_status or 'PENDING'
+
+    # Override status based on public chain verification for the consumer view
+    if final_status == 'packaged' and verification.get("verified", False):
+        final_status = 'VERIFIED_ON_PUBLIC_CHAIN'
+    elif final_status == 'packaged' and verification.get("degraded", False):
+        final_status = 'PUBLIC_VERIFICATION_PENDING'
+    elif final_status == 'packaged':
+        final_status = 'WARNING_PUBLIC_ANCHOR_MISSING'
+
+    return {
+        "status": final_status,
+        # Prioritize the Public Chain TX Hash, fallback to Fabric TX Hash
+        "blockchainTxHash": verification.get("txHash") or fabric_tx,
+    }
+
+
+def _anchors_settled(anchors: dict) -> bool:
+    return all(a.get("status") != "pending" for a in anchors.values())
+
+
+# ==============================
+# Snapshots
+# ==============================
+
+async def materialize(batch_doc: dict) -> dict:
+    """Stores the immutable scan payload of a packaged batch."""
+    packaging_info = batch_doc.get('packaging_data', {})
+    unit_id = packaging_info['unit_id']
+    anchors = batch_doc.get('anchors', {})
+    journey = build_journey(batch_doc, unit_id)
+    snapshot = {
+        "_id": unit_id,
+        "batch_id": batch_doc["batch_id"],
+        "batch_status": batch_doc.get("status"),
+        "format": SNAPSHOT_FORMAT,
+        "journey": journey,
+        "journey_etag": _digest(journey),
+        "fabric_final_tx": packaging_info.get("fabric_final_tx"),
+        "anchor_proofs": await build_anchor_proofs(anchors),
+        "anchors_settled": _anchors_settled(anchors),
+        "anchors_checked_at": datetime.utcnow(),
+        "createdAt": datetime.utcnow(),
+    }
+    await scan_snapshots_col.replace_one({"_id": unit_id}, snapshot, upsert=True)
+    _stats["materialized"] += 1
+    _remember(snapshot)
+    return snapshot
+
+
+async def refresh(batch_id: str):
+    """Re-materializes a packaged batch whose journey changed (e.g. a media upload finished)."""
+    batch_doc = await batches_col.find_one({"batch_id": batch_id}, SCAN_PROJECTION)
+    if batch_doc and batch_doc.get("status") == "packaged" and batch_doc.get("packaging_data", {}).get("unit_id"):
+        await materialize(batch_doc)
+
+
+def _remember(snapshot: dict):
+    expires_at = time.monotonic() + SCAN_SNAPSHOT_LRU_TTL
+    for key in (snapshot["_id"], snapshot["batch_id"]):
+        _lru[key] = (snapshot, expires_at)
+        _lru.move_to_end(key)
+    while len(_lru) > SCAN_SNAPSHOT_LRU_SIZE:
+        _lru.popitem(last=False)
+
+
+def invalidate(snapshot: dict):
+    _lru.pop(snapshot["_id"], None)
+    _lru.pop(snapshot["batch_id"], None)
+
+
+async def get_snapshot(scan_id: str) -> dict | None:
+    """Snapshot for a unit or batch id: LRU first, then the snapshot collection."""
+    entry = _lru.get(scan_id)
+    if entry and time.monotonic() < entry[1]:
+        _stats["lru_hits"] += 1
+        _lru.move_to_end(scan_id)
+        snapshot = entry[0]
+    else:
+        snapshot = await scan_snapshots_col.find_one({"$or": [{"_id": scan_id}, {"batch_id": scan_id}]})
+        if not snapshot or snapshot.get("format") != SNAPSHOT_FORMAT:
+            # Older formats stored resolved URLs; the caller re-materializes
+            _stats["misses"] += 1
+            return None
+        _stats["store_hits"] += 1
+        _remember(snapshot)
+
+    if not snapshot["anchors_settled"]:
+        _schedule_anchor_refresh(snapshot)
+    return snapshot
+
+
+def _schedule_anchor_refresh(snapshot: dict):
+    unit_id = snapshot["_id"]
+    checked_at = snapshot.get("anchors_checked_at")
+    if unit_id in _refreshing or (
+        checked_at and (datetime.utcnow() - checked_at).total_seconds() < SCAN_ANCHOR_RECHECK_SECONDS
+    ):
+        return
+    task = asyncio.create_task(_refresh_anchors(snapshot))
+    _refreshing[unit_id] = task
+    task.add_done_callback(lambda _: _refreshing.pop(unit_id, None))
+
+
+async def _refresh_anchors(snapshot: dict):
+    """Copies anchor results written after packaging into the snapshot."""
+    _stats["anchor_refreshes"] += 1
+    try:
+        batch_doc = await batches_col.find_one(
+            {"batch_id": snapshot["batch_id"]},
+            {"anchors": 1, "packaging_data.fabric_final_tx": 1},
+        )
+        if not batch_doc:
+            return
+        anchors = batch_doc.get("anchors", {})
+        fields = {
+            "fabric_final_tx": batch_doc.get("packaging_data", {}).get("fabric_final_tx"),
+            "anchor_proofs": await build_anchor_proofs(anchors),
+            "anchors_settled": _anchors_settled(anchors),
+            "anchors_checked_at": datetime.utcnow(),
+        }
+        await scan_snapshots_col.update_one({"_id": snapshot["_id"]}, {"$set": fields})
+        _remember({**snapshot, **fields})
+    except Exception as e:
+        print(f"Scan snapshot refresh failed for {snapshot['_id']}: {e}")
+
+
+def render(snapshot: dict, verification: dict) -> tuple[dict, str]:
+    """
+    Full PublicBatchDetails payload for a snapshot plus its strong ETag.
+    The ETag combines the stored journey digest with a digest of the small
+    per-request part (badge, proofs, media URL base), so revalidation never
+    re-hashes the journey.
+    """
+    overlay = {
+        **build_badge(snapshot["batch_status"], verification, snapshot.get("fabric_final_tx")),
+        "anchorProofs": snapshot.get("anchor_proofs", []),
+    }
+    # Media URLs follow the current gateway, so its base is part of the tag
+    etag = f'"{snapshot["journey_etag"]}-{_digest([overlay, get_public_url("{cid}")])[:16]}"'
+    return {**resolve_media(snapshot["journey"]), **overlay}, etag
+
+
+def stats() -> dict:
+    return {**_stats, "lru_entries": len(_lru), "refreshing": len(_refreshing)}
+
+
+metrics.register("scan_snapshots", stats)
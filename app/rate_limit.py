@@ -0,0 +1,177 @@
+# backend/app/rate_limit.py
+#
+# Token-bucket rate limiting for the unauthenticated endpoints, as plain ASGI
+# middleware (no per-request BaseHTTPMiddleware overhead).
+#
+# Each RULE gives a route class a refill rate (tokens/second) and a burst
+# size; buckets are keyed by client IP + rule. Rejected requests get a 429
+# with Retry-After. Buckets live in process memory by default; set
+# RATE_LIMIT_BACKEND=mongo to share them across API instances.
+
+import os
+import re
+import json
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+
+from app.database import rate_limits_col
+from app import metrics
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Only enable behind a proxy that overwrites X-Forwarded-For
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+
+
+class Rule:
+    def __init__(self, name: str, pattern: str, rate: float, burst: int):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.rate = rate
+        self.burst = burst
+
+
+def _rule(name: str, pattern: str, rate: str, burst: str) -> Rule:
+    env = name.upper()
+    return Rule(
+        name,
+        pattern,
+        float(os.getenv(f"RATE_LIMIT_{env}_RATE", rate)),
+        int(os.getenv(f"RATE_LIMIT_{env}_BURST", burst)),
+    )
+
+
+# First match wins. The public router is mounted with a second /api prefix,
+# hence the optional leading segment.
+RULES = [
+    _rule("public_scan_bulk", r"^(/api)?/api/public/scan/bulk$", "0.2", "3"),
+    _rule("public_scan", r"^(/api)?/api/public/scan/", "5", "30"),
+    _rule("reverse_geocode", r"^/api/utils/reverse-geocode$", "1", "5"),
+    _rule("media", r"^/api/media/", "20", "100"),
+]
+
+_stats = {rule.name: {"allowed": 0, "rejected": 0} for rule in RULES}
+
+
+class MemoryBackend:
+    """Buckets in this process; least recently used keys are dropped past RATE_LIMIT_MAX_KEYS."""
+
+    def __init__(self):
+        # key -> (tokens, updated_at)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Takes one token; returns 0 when allowed, else seconds until one is available."""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > RATE_LIMIT_MAX_KEYS:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+class MongoBackend:
+    """
+    Buckets shared through the rate_limits collection. The refill and take
+    happen in one pipeline update, so concurrent instances cannot both spend
+    the last token. Idle buckets expire via the TTL index on expires_at.
+    """
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = datetime.utcnow()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        refilled = {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]}
+        doc = await rate_limits_col.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": now + timedelta(seconds=burst / rate),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return 0.0 if doc["allowed"] else (1 - doc["tokens"]) / rate
+
+    def size(self) -> int | None:
+        return None
+
+
+_backend = MongoBackend() if RATE_LIMIT_BACKEND == "mongo" else MemoryBackend()
+
+
+def match(path: str) -> Rule | None:
+    for rule in RULES:
+        if rule.pattern.match(path):
+            return rule
+    return None
+
+
+def client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not RATE_LIMIT_ENABLED or scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        rule = match(scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            wait = await _backend.take(f"{rule.name}:{client_ip(scope)}", rule.rate, rule.burst)
+        except Exception as e:
+            # A limiter outage must not take the endpoints down with it
+            print(f"Rate limiter backend error: {e}")
+            wait = 0.0
+
+        if wait <= 0:
+            _stats[rule.name]["allowed"] += 1
+            return await self.app(scope, receive, send)
+
+        _stats[rule.name]["rejected"] += 1
+        body = json.dumps({"detail": "Too many requests, slow down."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(wait)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+metrics.register("rate_limit", lambda: {
+    "backend": RATE_LIMIT_BACKEND,
+    "tracked_keys": _backend.size(),
+    "routes": _stats,
+})
@@ -0,0 +1,223 @@
+# backend/app/resilience.py
+#
+# Circuit breakers and latency budgets for upstream services.
+#
+# Each upstream (Fabric bridge, Polygon verifier) gets a breaker that tracks
+# the outcome of its last BREAKER_WINDOW calls. Once at least
+# BREAKER_MIN_CALLS have been seen and the failure rate reaches
+# BREAKER_FAILURE_RATE, the breaker opens and calls fail fast with
+# CircuitOpenError. After BREAKER_OPEN_SECONDS it lets BREAKER_HALF_OPEN_PROBES
+# calls through; a successful probe closes it, a failed one re-opens it.
+# Cancelled calls (client disconnects, shutdown) give no verdict either way.
+#
+# Latency budgets cap how long an endpoint waits on an upstream before
+# answering with a degraded result or a 504 (see with_budget). A call cut off
+# by its budget counts as a failure, so a slow upstream trips its breaker
+# instead of piling requests up until the client timeout.
+
+import os
+import time
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+import httpx
+
+from app import metrics
+
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "50"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+# Per-endpoint latency budgets in milliseconds
+LATENCY_BUDGETS_MS = {
+    "public_scan_verify": float(os.getenv("BUDGET_PUBLIC_SCAN_VERIFY_MS", "300")),
+    "public_scan_bulk_verify": float(os.getenv("BUDGET_PUBLIC_SCAN_BULK_VERIFY_MS", "2000")),
+    "fabric_proxy": float(os.getenv("BUDGET_FABRIC_PROXY_MS", "3000")),
+}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit for upstream '{name}' is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BudgetExceeded(httpx.TimeoutException):
+    """Raised by with_budget when the budget expires and there is no fallback."""
+
+    def __init__(self, budget: str):
+        super().__init__(f"Latency budget '{budget}' exceeded")
+        self.budget = budget
+
+
+class _Budget:
+    """The budget a call runs under; `expired` is set just before it is cancelled."""
+
+    def __init__(self):
+        self.task: asyncio.Future | None = None
+        self.expired = False
+
+
+_current_budget: ContextVar[_Budget | None] = ContextVar("latency_budget", default=None)
+
+
+def _cut_by_budget() -> bool:
+    budget = _current_budget.get()
+    return budget is not None and budget.expired and budget.task is asyncio.current_task()
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.opened_until = 0.0
+        self.outcomes: deque[bool] = deque(maxlen=BREAKER_WINDOW)  # True = failure
+        self.probes_in_flight = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _failure_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_until = time.monotonic() + BREAKER_OPEN_SECONDS
+        self.times_opened += 1
+        print(f"Circuit breaker '{self.name}' opened (failure rate {self._failure_rate():.0%})")
+
+    def _close(self):
+        self.state = CLOSED
+        self.outcomes.clear()
+        print(f"Circuit breaker '{self.name}' closed")
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not go upstream."""
+        if self.state == OPEN:
+            remaining = self.opened_until - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, remaining)
+            self.state = HALF_OPEN
+
+        if self.state == HALF_OPEN:
+            if self.probes_in_flight >= BREAKER_HALF_OPEN_PROBES:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, BREAKER_OPEN_SECONDS)
+            self.probes_in_flight += 1
+
+    def release(self):
+        """Ends a call without a verdict (it was cancelled before the upstream answered)."""
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+
+    def after_call(self, failed: bool):
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+            if failed:
+                self._open()
+            else:
+                self._close()
+            return
+
+        self.outcomes.append(failed)
+        if (
+            self.state == CLOSED
+            and len(self.outcomes) >= BREAKER_MIN_CALLS
+            and self._failure_rate() >= BREAKER_FAILURE_RATE
+        ):
+            self._open()
+
+    async def __aenter__(self):
+        self.before_call()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # 4xx answers mean the upstream is alive; only 5xx, transport errors
+        # (timeouts, refused connections) and blown latency budgets count
+        # against it.
+        if exc_type is None:
+            failed = False
+        elif isinstance(exc, httpx.HTTPStatusError):
+            failed = exc.response.status_code >= 500
+        elif isinstance(exc, asyncio.CancelledError):
+            if not _cut_by_budget():
+                self.release()
+                return False
+            failed = True
+        else:
+            failed = True
+        self.after_call(failed)
+        return False
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failure_rate": round(self._failure_rate(), 3),
+            "window_calls": len(self.outcomes),
+            "open_for_seconds": round(max(self.opened_until - time.monotonic(), 0), 1) if self.state == OPEN else 0,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+_RAISE = object()
+_budget_stats = {name: {"expired": 0} for name in LATENCY_BUDGETS_MS}
+
+
+async def with_budget(budget: str, awaitable, fallback=_RAISE):
+    """
+    Awaits `awaitable` for at most the named latency budget and returns
+    `fallback` if it runs over (raises BudgetExceeded when no fallback is
+    given). The overrunning call is cancelled; wrap shared work in
+    asyncio.shield if it must keep running after the budget expires.
+    """
+    state = _Budget()
+    token = _current_budget.set(state)
+    try:
+        task = asyncio.ensure_future(awaitable)
+    finally:
+        _current_budget.reset(token)
+    state.task = task
+
+    try:
+        done, _ = await asyncio.wait({task}, timeout=LATENCY_BUDGETS_MS[budget] / 1000)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if not done:
+        state.expired = True
+        task.cancel()
+        await asyncio.wait({task})
+    if not task.cancelled():
+        # Finished in time (or in the same tick as the cancel)
+        return task.result()
+
+    _budget_stats[budget]["expired"] += 1
+    if fallback is _RAISE:
+        raise BudgetExceeded(budget)
+    return fallback
+
+
+metrics.register("circuit_breakers", lambda: {name: b.snapshot() for name, b in _breakers.items()})
+metrics.register("latency_budgets", lambda: {
+    name: {"budget_ms": LATENCY_BUDGETS_MS[name], **stats} for name, stats in _budget_stats.items()
+})
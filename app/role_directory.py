@@ -0,0 +1,125 @@
+# backend/app/role_directory.py
+#
+# In-memory directory of users by role (IDs + the display fields the admin
+# listings show). Loaded at startup, updated in place on registration and
+# fully reloaded every ROLE_DIRECTORY_RELOAD_SECONDS to pick up writes made
+# by other instances. `version` changes whenever the contents do; digest()
+# hashes a role's entries for ETags, so instances holding the same users
+# agree on the tag regardless of their local version counters.
+
+import os
+import json
+import asyncio
+import hashlib
+
+from app.database import users_col
+from app import metrics
+
+ROLE_DIRECTORY_RELOAD_SECONDS = float(os.getenv("ROLE_DIRECTORY_RELOAD_SECONDS", "300"))
+
+# Everything the listings and fan-out need; never the password hash
+DIRECTORY_PROJECTION = {
+    "fullName": 1, "email": 1, "role": 1, "status": 1, "region": 1,
+    "phone": 1, "organization": 1, "labName": 1, "companyName": 1, "licenseNumber": 1,
+    "accreditation": 1, "turnaround": 1, "acceptanceRate": 1,
+    "assignedBatches": 1, "completed": 1, "avgTime": 1, "accuracy": 1, "rating": 1,
+    "stats": 1, "createdAt": 1,
+}
+
+# role -> {user_id: entry}
+_members: dict[str, dict[str, dict]] = {}
+_version = 0
+# role -> (version it was computed at, digest)
+_digests: dict[str, tuple[int, str]] = {}
+_reload_task: asyncio.Task | None = None
+
+
+def _entry(user: dict) -> dict:
+    entry = {k: v for k, v in user.items() if k in DIRECTORY_PROJECTION}
+    entry["id"] = str(user["_id"])
+    return entry
+
+
+def version() -> int:
+    return _version
+
+
+def digest(role: str) -> str:
+    """Content hash of a role's entries; recomputed only after the directory changed."""
+    cached = _digests.get(role)
+    if cached and cached[0] == _version:
+        return cached[1]
+    value = hashlib.sha256(
+        json.dumps(members(role), sort_keys=True, separators=(",", ":"), default=str).encode()
+    ).hexdigest()[:32]
+    _digests[role] = (_version, value)
+    return value
+
+
+def members(role: str) -> list[dict]:
+    """Directory entries for a role, in registration order."""
+    return list(_members.get(role, {}).values())
+
+
+def ids(role: str) -> list[str]:
+    return list(_members.get(role, {}))
+
+
+def add(user: dict):
+    """Adds or replaces one user (a document that already has its _id)."""
+    global _version
+    _members.setdefault(user["role"], {})[str(user["_id"])] = _entry(user)
+    _version += 1
+
+
+def update(role: str, user_id: str, fields: dict):
+    """Patches display fields of a known user; unknown users are left to the next reload."""
+    global _version
+    entry = _members.get(role, {}).get(user_id)
+    if entry is not None:
+        entry.update(fields)
+        _version += 1
+
+
+async def load():
+    """Rebuilds the directory from users_col; bumps the version only on change."""
+    global _members, _version
+    fresh: dict[str, dict[str, dict]] = {}
+    async for user in users_col.find({}, DIRECTORY_PROJECTION).sort("_id", 1):
+        if user.get("role"):
+            fresh.setdefault(user["role"], {})[str(user["_id"])] = _entry(user)
+    if fresh != _members:
+        _members = fresh
+        _version += 1
+
+
+async def run_reloader():
+    while True:
+        await asyncio.sleep(ROLE_DIRECTORY_RELOAD_SECONDS)
+        try:
+            await load()
+        except Exception as e:
+            print(f"Role directory reload failed: {e}")
+
+
+def start():
+    global _reload_task
+    if _reload_task is None or _reload_task.done():
+        _reload_task = asyncio.create_task(run_reloader())
+
+
+async def stop():
+    global _reload_task
+    if _reload_task:
+        _reload_task.cancel()
+        try:
+            await _reload_task
+        except asyncio.CancelledError:
+            pass
+        _reload_task = None
+
+
+metrics.register("role_directory", lambda: {
+    "version": _version,
+    "members": {role: len(users) for role, users in _members.items()},
+})
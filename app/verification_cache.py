@@ -0,0 +1,84 @@
+# backend/app/verification_cache.py
+#
+# In-process cache in front of blockchain_client.verify_token (Polygon).
+# - positive results live for VERIFY_CACHE_TTL, negative ones for the shorter
+#   VERIFY_CACHE_NEGATIVE_TTL so a freshly minted token shows up quickly;
+#   degraded answers (upstream unavailable) are never cached
+# - concurrent lookups of the same unit share one upstream call
+# - entries past VERIFY_CACHE_REFRESH_AT of their TTL are served as-is while a
+#   background refresh replaces them, so hot products never wait on Polygon
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+
+from app.blockchain_client import verify_token
+from app import metrics
+
+VERIFY_CACHE_TTL = float(os.getenv("VERIFY_CACHE_TTL", "3600"))
+VERIFY_CACHE_NEGATIVE_TTL = float(os.getenv("VERIFY_CACHE_NEGATIVE_TTL", "60"))
+VERIFY_CACHE_REFRESH_AT = float(os.getenv("VERIFY_CACHE_REFRESH_AT", "0.8"))
+VERIFY_CACHE_MAX_ENTRIES = int(os.getenv("VERIFY_CACHE_MAX_ENTRIES", "10000"))
+
+# unit_id -> (result, refresh_at, expires_at), in LRU order
+_cache: OrderedDict[str, tuple[dict, float, float]] = OrderedDict()
+_inflight: dict[str, asyncio.Task] = {}
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "refreshes": 0}
+
+
+async def _load(unit_id: str) -> dict:
+    result = await verify_token(unit_id)
+    if result.get("degraded"):
+        # Breaker open, network error or 5xx: answer now, but don't pin the
+        # outage into the cache as a negative result
+        return result
+    ttl = VERIFY_CACHE_TTL if result.get("verified") else VERIFY_CACHE_NEGATIVE_TTL
+    now = time.monotonic()
+    _cache[unit_id] = (result, now + ttl * VERIFY_CACHE_REFRESH_AT, now + ttl)
+    _cache.move_to_end(unit_id)
+    while len(_cache) > VERIFY_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+    return result
+
+
+def _fetch(unit_id: str) -> asyncio.Task:
+    """Returns the in-flight upstream call for a unit, starting one if needed."""
+    task = _inflight.get(unit_id)
+    if task is not None:
+        _stats["coalesced"] += 1
+        return task
+
+    task = asyncio.create_task(_load(unit_id))
+    _inflight[unit_id] = task
+    task.add_done_callback(lambda _: _inflight.pop(unit_id, None))
+    return task
+
+
+async def get_verification(unit_id: str) -> dict:
+    """Cached equivalent of verify_token(unit_id)."""
+    entry = _cache.get(unit_id)
+    now = time.monotonic()
+
+    if entry and now < entry[2]:
+        _stats["hits"] += 1
+        _cache.move_to_end(unit_id)
+        if now >= entry[1] and unit_id not in _inflight:
+            _stats["refreshes"] += 1
+            _fetch(unit_id)
+        return entry[0]
+
+    _stats["misses"] += 1
+    # shield: a cancelled request must not cancel the call other scans share
+    return await asyncio.shield(_fetch(unit_id))
+
+
+def invalidate(unit_id: str):
+    _cache.pop(unit_id, None)
+
+
+def stats() -> dict:
+    return {**_stats, "entries": len(_cache), "inflight": len(_inflight)}
+
+
+metrics.register("verification_cache", stats)
@@ -1,10 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Form, UploadFile, File, Request
-from app.database import batches_col, batch_helper,users_col
-from utils.jwt import verify_token
+from fastapi import APIRouter, Depends, HTTPException, Body, Form, UploadFile, File, Request, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.database import batches_col, batch_helper,users_col, anchor_jobs_col, media_jobs_col
+from app import anchor_outbox, media_spool, role_directory, actor_stats, geo
+from app.role_directory import DIRECTORY_PROJECTION
+from app.pagination import keyset_filter, parse_sort, next_cursor
+from utils.jwt import require_role
 from utils.notify import notify
 from pydantic import BaseModel
 from datetime import datetime
 import random
+import asyncio
+import os
+import re
+import io
+import csv
+import json
 from bson import ObjectId
 class ActorAssign(BaseModel):
     id: str
@@ -13,16 +23,15 @@ class ActorAssign(BaseModel):
 
 
 router = APIRouter(prefix="/admin", tags=["Admin"]) 
+require_admin = require_role("Admin")
 
 # 1. Dashboard (The root data fetch) - Frontend call: adminApi.get("dashboard")
 @router.get("/dashboard")
-async def admin_dashboard(user=Depends(verify_token)):
-    if user["role"] != "Admin":
-        raise HTTPException(403)
+async def admin_dashboard(user=Depends(require_admin)):
     
-    collector_count = await users_col.count_documents({"role": "Collector"})
-    tester_count = await users_col.count_documents({"role": "Tester"})
-    manufacturer_count = await users_col.count_documents({"role": "Manufacturer"})
+    collector_count = len(role_directory.ids("Collector"))
+    tester_count = len(role_directory.ids("Tester"))
+    manufacturer_count = len(role_directory.ids("Manufacturer"))
     
     # Get batches (you already have this)
     batches = [batch_helper(b) async for b in batches_col.find()]
@@ -39,18 +48,25 @@ async def admin_dashboard(user=Depends(verify_token)):
     }
 # 2. Assign Collector - Frontend call: adminApi.put("assign-collector/{batch_id}")
 @router.put("/assign-collector/{batch_id}")
-async def assign_collector(batch_id: str, actor: ActorAssign, user=Depends(verify_token)):
-    if user["role"] != "Admin":
-        raise HTTPException(403)
+async def assign_collector(batch_id: str, actor: ActorAssign, user=Depends(require_admin)):
 
-    await batches_col.update_one(
+    previous = await batches_col.find_one_and_update(
         {"batch_id": batch_id},
         {"$set": {
             "collector_data": actor.dict(),
             "status": "collection_assigned",
             "timeline.collection_assigned": datetime.utcnow().isoformat()
-        }}
+        }},
+        projection={"collector_data.id": 1},
     )
+    if not previous:
+        raise HTTPException(404, "Batch not found")
+
+    # Stats count each batch once, under its current collector
+    previous_id = (previous.get("collector_data") or {}).get("id")
+    if previous_id != actor.id:
+        await actor_stats.collector_unassigned(previous_id)
+        await actor_stats.collector_assigned(actor.id)
     await notify(
     user_id=actor.id,
     role="Collector",
@@ -67,10 +83,8 @@ async def assign_collector(batch_id: str, actor: ActorAssign, user=Depends(verif
 async def select_manufacturer(
     batch_id: str = Body(...),
     manufacturer_id: str = Body(...),
-    user=Depends(verify_token)
+    user=Depends(require_admin)
 ):
-    if user["role"] != "Admin":
-        raise HTTPException(403)
 
     batch = await batches_col.find_one({"batch_id": batch_id})
     if not batch:
@@ -113,9 +127,7 @@ async def select_manufacturer(
 
 # 4. Get Quotes - Frontend call: adminApi.get("quotes/{batch_id}")
 @router.get("/quotes/{batch_id}")
-async def get_quotes(batch_id: str, user=Depends(verify_token)):
-    if user["role"] != "Admin":
-        raise HTTPException(403)
+async def get_quotes(batch_id: str, user=Depends(require_admin)):
 
     batch = await batches_col.find_one({"batch_id": batch_id})
     if not batch:
@@ -127,10 +139,8 @@ async def get_quotes(batch_id: str, user=Depends(verify_token)):
 @router.post("/publish-tester-request")
 async def publish_tester_request(
     batch_id: str = Body(...),
-    user=Depends(verify_token)
+    user=Depends(require_admin)
 ):
-    if user["role"] != "Admin":
-        raise HTTPException(403, "Admins only")
 
     batch = await batches_col.find_one({"batch_id": batch_id})
     if not batch:
@@ -159,6 +169,7 @@ async def publish_tester_request(
             }
         }
     )
+    await actor_stats.test_offered()
 
     # 🔔 Notify ALL testers (fan-out notification)
     await notify(
@@ -175,66 +186,442 @@ async def publish_tester_request(
         "batch_id": batch_id
     }
     
-# 6. /admin/collectors (Requires DB logic to fetch lists of users by role)
+def _directory_listing(request: Request, role: str, formatter):
+    """
+    Role listing served from the in-memory role directory. The ETag is a
+    digest of the role's entries, so unchanged listings revalidate with a
+    304 on any instance.
+    """
+    etag = f'W/"{role}-{role_directory.digest(role)}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(
+        [formatter(member) for member in role_directory.members(role)],
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
+
+
+USER_SORTS = {"name": "fullName", "rating": "rating", "status": "status", "createdAt": "createdAt"}
+LISTING_PAGE_SIZE = 50
+
+
+def listing_params(
+    q: str | None = Query(None, description="Full-text search over name, region, lab and company"),
+    status: str | None = None,
+    region: str | None = None,
+    sort: str | None = Query(None, description="name | rating | status | createdAt, '-' prefix for descending"),
+    limit: int | None = Query(None, ge=1, le=200),
+    cursor: str | None = Query(None, description="X-Next-Cursor from the previous page"),
+) -> dict:
+    return {"q": q, "status": status, "region": region, "sort": sort, "limit": limit, "cursor": cursor}
+
+
+async def _user_listing(request: Request, role: str, formatter, params: dict):
+    """
+    Without parameters: the whole role from the directory. With any of
+    search / filter / sort / paging: an indexed, keyset-paginated query;
+    the next page's cursor is returned in X-Next-Cursor.
+    """
+    if not any(params.values()):
+        return _directory_listing(request, role, formatter)
+
+    field, direction = parse_sort(params["sort"] or "name", USER_SORTS)
+    limit = params["limit"] or LISTING_PAGE_SIZE
+    query = {"role": role}
+    if params["q"]:
+        query["$text"] = {"$search": params["q"]}
+    if params["status"]:
+        query["status"] = params["status"]
+    if params["region"]:
+        query["region"] = params["region"]
+    query.update(keyset_filter(field, direction, params["cursor"]))
+
+    rows = await users_col.find(query, DIRECTORY_PROJECTION) \
+        .sort([(field, direction), ("_id", direction)]) \
+        .limit(limit) \
+        .to_list(length=limit)
+
+    cursor = next_cursor(rows, field, limit)
+    return JSONResponse(
+        [formatter({**row, "id": str(row["_id"])}) for row in rows],
+        headers={"X-Next-Cursor": cursor} if cursor else {},
+    )
+
+
+def _collector_row(collector: dict) -> dict:
+    return {
+        "id": collector["id"],
+        "name": collector.get("fullName", "Unknown"),
+        "region": collector.get("region", "Unknown"),
+        **actor_stats.collector_display(collector),
+        "rating": collector.get("rating", 0),
+        "status": collector.get("status", "active")
+    }
+
+
+def _tester_row(tester: dict) -> dict:
+    return {
+        "id": tester["id"],
+        "name": tester.get("fullName", "Unknown Lab"),
+        "accreditation": tester.get("accreditation", "Unknown"),
+        "accuracy": tester.get("accuracy", "0%"),
+        **actor_stats.tester_display(tester),
+        "rating": tester.get("rating", 0),
+        "status": tester.get("status", "active"),
+        "labName": tester.get("labName", ""),
+        "licenseNumber": tester.get("licenseNumber", "")
+    }
+
+
+def _manufacturer_row(manufacturer: dict) -> dict:
+    return {
+        "id": manufacturer["id"],
+        "name": manufacturer.get("fullName", "Unknown Company"),
+        "status": manufacturer.get("status", "active"),
+        "companyName": manufacturer.get("companyName", ""),
+        "licenseNumber": manufacturer.get("licenseNumber", ""),
+        "email": manufacturer.get("email", "")
+    }
+
+
+# 6. /admin/collectors (role directory, or search / filter / keyset pages)
 @router.get("/collectors")
-async def admin_collectors(user=Depends(verify_token)):
-    if user["role"] != "Admin":  
-        raise HTTPException(403)
-    test_result = await users_col.find({"role": "Collector"}).to_list(length=5)
-    collectors = await users_col.find({"role": "Collector"}).to_list(length=100)
-    result = []
-    for collector in collectors:
-        result.append({
-            "id": str(collector.get("_id")),
-            "name": collector.get("fullName", "Unknown"),
-            "region": collector.get("region", "Unknown"),
-            "assignedBatches": collector.get("assignedBatches", 0),
-            "completed": collector.get("completed", 0),
-            "avgTime": collector.get("avgTime", "N/A"),
-            "accuracy": collector.get("accuracy", "0%"),
-            "rating": collector.get("rating", 0),
-            "status": collector.get("status", "active")
-        })
-    return result    
+async def admin_collectors(request: Request, params: dict = Depends(listing_params), user=Depends(require_admin)):
+    return await _user_listing(request, "Collector", _collector_row, params)
 # 7. /admin/testers
 @router.get("/testers")
-async def admin_testers(user=Depends(verify_token)):
-    if user["role"] != "Admin":
-        raise HTTPException(403)
-    testers = await users_col.find({"role": "Tester"}).to_list(length=100)
-    
-    result = []
-    for tester in testers:
-        result.append({
-            "id": str(tester.get("_id")),
-            "name": tester.get("fullName", "Unknown Lab"),
-            "accreditation": tester.get("accreditation", "Unknown"),
-            "turnaround": tester.get("turnaround", "N/A"),
-            "accuracy": tester.get("accuracy", "0%"),
-            "acceptanceRate": tester.get("acceptanceRate", "0%"),
-            "rating": tester.get("rating", 0),
-            "status": tester.get("status", "active"),
-            "labName": tester.get("labName", ""),
-            "licenseNumber": tester.get("licenseNumber", "")
-        })
-    
-    return result
+async def admin_testers(request: Request, params: dict = Depends(listing_params), user=Depends(require_admin)):
+    return await _user_listing(request, "Tester", _tester_row, params)
 # 8. /admin/manufacturers
 @router.get("/manufacturers")
-async def admin_manufacturers(user=Depends(verify_token)):
-    if user["role"] != "Admin":
-        raise HTTPException(403)
-    manufacturers = await users_col.find({"role": "Manufacturer"}).to_list(length=100)
-    
-    result = []
-    for manufacturer in manufacturers:
-        result.append({
-            "id": str(manufacturer.get("_id")),
-            "name": manufacturer.get("fullName", "Unknown Company"),
-            "status": manufacturer.get("status", "active"),
-            "companyName": manufacturer.get("companyName", ""),
-            "licenseNumber": manufacturer.get("licenseNumber", ""),
-            "email": manufacturer.get("email", "")
-        })
-    
-    return result
\ No newline at end of file
+async def admin_manufacturers(request: Request, params: dict = Depends(listing_params), user=Depends(require_admin)):
+    return await _user_listing(request, "Manufacturer", _manufacturer_row, params)
+# 9. /admin/anchors - Fabric anchoring outbox (pending / failed jobs)
+@router.get("/anchors")
+async def admin_anchor_jobs(status: str = "failed", user=Depends(require_admin)):
+    jobs = await anchor_jobs_col.find({"status": status}).sort("updatedAt", -1).to_list(length=100)
+
+    return [
+        {
+            "id": str(job["_id"]),
+            "batch_id": job.get("batch_id"),
+            "kind": job.get("kind"),
+            "status": job.get("status"),
+            "attempts": job.get("attempts", 0),
+            "last_error": job.get("last_error"),
+            "tx_hash": job.get("tx_hash"),
+            "next_attempt_at": job.get("next_attempt_at"),
+            "updatedAt": job.get("updatedAt"),
+        }
+        for job in jobs
+    ]
+# 10. /admin/anchors/{job_id}/retry
+@router.post("/anchors/{job_id}/retry")
+async def admin_retry_anchor(job_id: str, user=Depends(require_admin)):
+    job = await anchor_outbox.retry_anchor(job_id)
+    if not job:
+        raise HTTPException(404, "No failed anchor job with this id")
+    return {"message": "Anchor job re-queued", "batch_id": job["batch_id"], "kind": job["kind"]}
+# 11. /admin/media-jobs - IPFS upload spool (pending / failed uploads)
+@router.get("/media-jobs")
+async def admin_media_jobs(status: str = "failed", user=Depends(require_admin)):
+    jobs = await media_jobs_col.find({"status": status}).sort("updatedAt", -1).to_list(length=100)
+
+    return [
+        {
+            "id": str(job["_id"]),
+            "batch_id": job.get("batch_id"),
+            "field": job.get("cid_field"),
+            "filename": job.get("filename"),
+            "size": job.get("size"),
+            "status": job.get("status"),
+            "attempts": job.get("attempts", 0),
+            "last_error": job.get("last_error"),
+            "next_attempt_at": job.get("next_attempt_at"),
+            "updatedAt": job.get("updatedAt"),
+        }
+        for job in jobs
+    ]
+# 12. /admin/media-jobs/{job_id}/retry
+@router.post("/media-jobs/{job_id}/retry")
+async def admin_retry_media(job_id: str, user=Depends(require_admin)):
+    job = await media_spool.retry_media(job_id)
+    if not job:
+        raise HTTPException(404, "No failed media job with this id")
+    return {"message": "Media upload re-queued", "batch_id": job["batch_id"], "field": job["cid_field"]}
+# 13. /admin/batches/search - full-text search, facets and keyset pages
+BATCH_SORTS = {"createdAt": "createdAt", "name": "herb_name", "status": "status"}
+BATCH_SEARCH_PROJECTION = {
+    "batch_id": 1, "herb_name": 1, "status": 1, "quantity": 1, "farmer_name": 1, "location": 1,
+    "createdAt": 1, "lab_data.summary": 1, "lab_data.tester_id": 1, "lab_data.tester_name": 1,
+    "collector_data.id": 1, "collector_data.name": 1,
+}
+
+
+def _batch_match(q, status, collector_id, tester_id, created_from, created_to) -> dict:
+    """Batch filter shared by search and export."""
+    match = {}
+    if q:
+        match["$text"] = {"$search": q}
+    if status:
+        match["status"] = {"$in": status}
+    if collector_id:
+        match["collector_data.id"] = collector_id
+    if tester_id:
+        match["lab_data.tester_id"] = tester_id
+    if created_from or created_to:
+        match["createdAt"] = {
+            **({"$gte": created_from} if created_from else {}),
+            **({"$lt": created_to} if created_to else {}),
+        }
+    return match
+
+
+@router.get("/batches/search")
+async def admin_batch_search(
+    q: str | None = Query(None, description="Full-text search over herb, farmer and location"),
+    status: list[str] | None = Query(None),
+    collector_id: str | None = None,
+    tester_id: str | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    sort: str = Query("-createdAt", description="createdAt | name | status, '-' prefix for descending"),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = None,
+    user=Depends(require_admin),
+):
+    """
+    Returns a keyset page and, on the first page, facet counts (status,
+    collector, tester, month) over everything the filters match. The page is
+    a plain indexed find; $facet sub-pipelines cannot use indexes, so only
+    the first-page counts go through it. Follow-up pages pass `nextCursor`
+    back as `cursor`.
+    """
+    field, direction = parse_sort(sort, BATCH_SORTS)
+    match = _batch_match(q, status, collector_id, tester_id, created_from, created_to)
+
+    page = batches_col.find({**match, **keyset_filter(field, direction, cursor)}, BATCH_SEARCH_PROJECTION) \
+        .sort([(field, direction), ("_id", direction)]) \
+        .limit(limit) \
+        .to_list(length=limit)
+    if cursor:
+        rows = await page
+    else:
+        facets = {
+            "total": [{"$count": "count"}],
+            "status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}, {"$sort": {"count": -1}}],
+            "collectors": [
+                {"$match": {"collector_data.id": {"$ne": None}}},
+                {"$group": {"_id": "$collector_data.id", "name": {"$first": "$collector_data.name"}, "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}},
+                {"$limit": 50},
+            ],
+            "testers": [
+                {"$match": {"lab_data.tester_id": {"$ne": None}}},
+                {"$group": {"_id": "$lab_data.tester_id", "name": {"$first": "$lab_data.tester_name"}, "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}},
+                {"$limit": 50},
+            ],
+            "months": [
+                {"$match": {"createdAt": {"$type": "date"}}},
+                {"$group": {"_id": {"$dateToString": {"format": "%Y-%m", "date": "$createdAt"}}, "count": {"$sum": 1}}},
+                {"$sort": {"_id": 1}},
+            ],
+        }
+        rows, counts = await asyncio.gather(
+            page,
+            batches_col.aggregate([{"$match": match}, {"$facet": facets}]).to_list(length=1),
+        )
+        result = counts[0]
+
+    response = {
+        "items": [
+            {
+                **batch_helper(b),
+                "collectorId": b.get("collector_data", {}).get("id"),
+                "collectorName": b.get("collector_data", {}).get("name"),
+                "testerId": b.get("lab_data", {}).get("tester_id"),
+                "testerName": b.get("lab_data", {}).get("tester_name"),
+            }
+            for b in rows
+        ],
+        "nextCursor": next_cursor(rows, field, limit),
+    }
+    if not cursor:
+        response["total"] = result["total"][0]["count"] if result["total"] else 0
+        response["facets"] = {
+            "status": [{"value": f["_id"], "count": f["count"]} for f in result["status"]],
+            "collectors": [{"id": f["_id"], "name": f["name"], "count": f["count"]} for f in result["collectors"]],
+            "testers": [{"id": f["_id"], "name": f["name"], "count": f["count"]} for f in result["testers"]],
+            "months": [{"month": f["_id"], "count": f["count"]} for f in result["months"]],
+        }
+    return response
+# 14. /admin/batches/near - batches within a radius, nearest first
+@router.get("/batches/near")
+async def admin_batches_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(20, gt=0, le=1000),
+    status: list[str] | None = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    user=Depends(require_admin),
+):
+    query = {"status": {"$in": status}} if status else {}
+    pipeline = [
+        {"$geoNear": {
+            "near": geo.point(lat, lon),
+            "distanceField": "distance_m",
+            "maxDistance": radius_km * 1000,
+            "spherical": True,
+            "query": query,
+        }},
+        {"$limit": limit},
+        {"$project": {**BATCH_SEARCH_PROJECTION, "geo": 1, "distance_m": 1}},
+    ]
+    return [
+        {
+            **batch_helper(b),
+            "coordinates": b["geo"]["coordinates"],
+            "distanceKm": round(b["distance_m"] / 1000, 3),
+        }
+        async for b in batches_col.aggregate(pipeline)
+    ]
+# 15. /admin/batches/heatmap - batch counts per grid cell
+@router.get("/batches/heatmap")
+async def admin_batches_heatmap(
+    cell_deg: float = Query(0.5, gt=0, le=10, description="Grid cell size in degrees"),
+    lat: float | None = Query(None, ge=-90, le=90),
+    lon: float | None = Query(None, ge=-180, le=180),
+    radius_km: float | None = Query(None, gt=0, le=5000),
+    status: list[str] | None = Query(None),
+    user=Depends(require_admin),
+):
+    """Buckets farm locations into cell_deg x cell_deg cells, optionally around a point."""
+    match = {"geo.type": "Point"}
+    if lat is not None and lon is not None and radius_km:
+        # $centerSphere takes radians: distance / Earth radius
+        match["geo"] = {"$geoWithin": {"$centerSphere": [[lon, lat], radius_km / 6378.1]}}
+    if status:
+        match["status"] = {"$in": status}
+
+    def cell(axis: int) -> dict:
+        coordinate = {"$arrayElemAt": ["$geo.coordinates", axis]}
+        return {"$multiply": [{"$floor": {"$divide": [coordinate, cell_deg]}}, cell_deg]}
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"lon": cell(0), "lat": cell(1), "status": {"$ifNull": ["$status", "unknown"]}},
+            "count": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": {"lon": "$_id.lon", "lat": "$_id.lat"},
+            "count": {"$sum": "$count"},
+            "statuses": {"$push": {"k": "$_id.status", "v": "$count"}},
+        }},
+        {"$sort": {"count": -1}},
+    ]
+    buckets = [
+        {
+            # Cell centre plus its south-west corner for exact tiling
+            "lat": b["_id"]["lat"] + cell_deg / 2,
+            "lon": b["_id"]["lon"] + cell_deg / 2,
+            "south": b["_id"]["lat"],
+            "west": b["_id"]["lon"],
+            "count": b["count"],
+            "statuses": {s["k"]: s["v"] for s in b["statuses"]},
+        }
+        async for b in batches_col.aggregate(pipeline)
+    ]
+    return {"cellDeg": cell_deg, "buckets": buckets}
+# 16. /admin/export/batches - streamed CSV / NDJSON export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_DEFAULT_FIELDS = [
+    "batch_id", "herb_name", "status", "farmer_id", "farmer_name", "location", "createdAt",
+    "collector_data.id", "collector_data.name", "lab_data.tester_id", "lab_data.results.passed",
+    "lab_data.submitted_at", "manufacturer_data.id", "packaging_data.unit_id", "blockchain_tx",
+]
+_EXPORT_FIELD = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)*$")
+
+
+def _export_value(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+@router.get("/export/batches")
+async def admin_export_batches(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    fields: str | None = Query(None, description="Comma-separated dotted field paths"),
+    q: str | None = None,
+    status: list[str] | None = Query(None),
+    collector_id: str | None = None,
+    tester_id: str | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    user=Depends(require_admin),
+):
+    """
+    Streams every matching batch straight from a Mongo cursor (fetched
+    EXPORT_BATCH_SIZE documents at a time), so memory stays flat however
+    many batches are exported.
+    """
+    columns = [f.strip() for f in fields.split(",") if f.strip()] if fields else EXPORT_DEFAULT_FIELDS
+    invalid = [c for c in columns if not _EXPORT_FIELD.match(c)]
+    if invalid:
+        raise HTTPException(400, f"Invalid field names: {', '.join(invalid)}")
+
+    # Project only the topmost path when a parent and its child are both asked for
+    projection = {c: 1 for c in columns if not any(c.startswith(p + ".") for p in columns)}
+    # Mongo returns _id unless excluded, so drop it only when it was not asked for
+    projection.setdefault("_id", 0)
+    cursor = batches_col.find(
+        _batch_match(q, status, collector_id, tester_id, created_from, created_to),
+        projection,
+    ).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+
+    async def rows_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        count = 0
+        try:
+            async for doc in cursor:
+                writer.writerow([
+                    json.dumps(v, default=str) if isinstance(v, (dict, list)) else v
+                    for v in (_export_value(doc, c) for c in columns)
+                ])
+                count += 1
+                if count % EXPORT_BATCH_SIZE == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            await cursor.close()
+
+    async def rows_ndjson():
+        lines = []
+        try:
+            async for doc in cursor:
+                lines.append(json.dumps({c: _export_value(doc, c) for c in columns}, default=str))
+                if len(lines) >= EXPORT_BATCH_SIZE:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+        finally:
+            await cursor.close()
+
+    filename = f"batches-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        rows_csv() if format == "csv" else rows_ndjson(),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
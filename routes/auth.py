@@ -1,10 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from passlib.context import CryptContext
-from pydantic import BaseModel, EmailStr, validator
+from pydantic import BaseModel, EmailStr, Field, validator
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from typing import List
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
-from app.database import users_col, user_helper
-from utils.jwt import create_token
+from app.database import users_col, user_helper, email_index_ready
+from app import role_directory
+from utils.jwt import create_token, require_role
 import os
 
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
@@ -14,9 +19,32 @@ router = APIRouter(prefix="/auth", tags=["Auth"])
 
 # ================ CHANGE THIS ================
 # From bcrypt to pbkdf2_sha256 (no password length limit)
-pwd_ctx = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Hashes below PASSWORD_HASH_ROUNDS are re-hashed on the next successful login.
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+pwd_ctx = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_HASH_ROUNDS,
+)
 # ============================================
 
+# pbkdf2 is CPU-bound (and releases the GIL); keep it off the event loop in a
+# bounded pool so a login storm queues here instead of stalling every request.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwhash")
+
+
+async def hash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, pwd_ctx.hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> tuple[bool, str | None]:
+    """Returns (valid, new_hash); new_hash is set when the stored hash needs upgrading."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_pool, pwd_ctx.verify_and_update, password, password_hash
+    )
+
 # =========================
 # REQUEST MODELS
 # =========================
@@ -61,20 +89,12 @@ class LoginRequest(BaseModel):
 # REGISTER
 # =========================
 
-@router.post("/register")
-async def register_user(data: RegisterRequest):
-    if data.role == "Admin":
-        raise HTTPException(status_code=403, detail="Admin cannot be registered")
-
-    if await users_col.find_one({"email": data.email}):
-        raise HTTPException(status_code=400, detail="Email already exists")
-
-    # Build user document
+def _user_document(data: RegisterRequest, password_hash: str) -> dict:
     user_doc = {
         "fullName": data.fullName,
         "email": data.email,
         "role": data.role,
-        "passwordHash": pwd_ctx.hash(data.password),  # This will work with pbkdf2
+        "passwordHash": password_hash,  # This will work with pbkdf2
         "createdAt": datetime.utcnow(),
     }
     
@@ -97,10 +117,83 @@ async def register_user(data: RegisterRequest):
         if data.licenseNumber:
             user_doc["licenseNumber"] = data.licenseNumber
 
-    await users_col.insert_one(user_doc)
+    return user_doc
+
+
+@router.post("/register")
+async def register_user(data: RegisterRequest):
+    if data.role == "Admin":
+        raise HTTPException(status_code=403, detail="Admin cannot be registered")
+
+    # Uniqueness is enforced by the unique index on email (see ensure_indexes);
+    # without it, fall back to checking first
+    if not email_index_ready() and await users_col.find_one({"email": data.email}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="Email already exists")
+
+    user_doc = _user_document(data, await hash_password(data.password))
+    try:
+        await users_col.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already exists")
+    role_directory.add(user_doc)
     return {"message": "Registered successfully"}
 
 
+class BulkRegisterRequest(BaseModel):
+    users: List[RegisterRequest] = Field(min_items=1, max_items=500)
+
+
+@router.post("/register/bulk")
+async def register_users_bulk(data: BulkRegisterRequest, user=Depends(require_role("Admin"))):
+    """
+    Onboards many users (e.g. a whole collector cooperative) with one
+    unordered insert_many. Valid entries are inserted even when others fail.
+    """
+    failed = [
+        {"index": i, "email": u.email, "reason": "Admin cannot be registered"}
+        for i, u in enumerate(data.users) if u.role == "Admin"
+    ]
+    candidates = [(i, u) for i, u in enumerate(data.users) if u.role != "Admin"]
+    if not email_index_ready():
+        # No unique index to reject duplicates: drop taken and repeated emails here
+        taken = {
+            doc["email"] async for doc in users_col.find(
+                {"email": {"$in": [u.email for _, u in candidates]}}, {"email": 1}
+            )
+        }
+        unique = []
+        for i, u in candidates:
+            if u.email in taken:
+                failed.append({"index": i, "email": u.email, "reason": "Email already exists"})
+            else:
+                taken.add(u.email)
+                unique.append((i, u))
+        candidates = unique
+    if not candidates:
+        return {"inserted": 0, "failed": sorted(failed, key=lambda f: f["index"])}
+
+    hashes = await asyncio.gather(*(hash_password(u.password) for _, u in candidates))
+    docs = [_user_document(u, h) for (_, u), h in zip(candidates, hashes)]
+
+    inserted = len(docs)
+    rejected = set()
+    try:
+        await users_col.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        inserted = e.details.get("nInserted", 0)
+        for err in e.details.get("writeErrors", []):
+            rejected.add(err["index"])
+            index, entry = candidates[err["index"]]
+            reason = "Email already exists" if err.get("code") == 11000 else err.get("errmsg", "Insert failed")
+            failed.append({"index": index, "email": entry.email, "reason": reason})
+
+    for position, doc in enumerate(docs):
+        if position not in rejected:
+            role_directory.add(doc)
+
+    return {"inserted": inserted, "failed": sorted(failed, key=lambda f: f["index"])}
+
+
 # =========================
 # LOGIN
 # =========================
@@ -135,8 +228,15 @@ async def login_user(data: LoginRequest):
         "role": data.role
     })
 
-    if not user or "passwordHash" not in user or not pwd_ctx.verify(data.password, user["passwordHash"]):
+    if not user or "passwordHash" not in user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    valid, new_hash = await verify_password(data.password, user["passwordHash"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Created with older parameters: upgrade transparently
+        await users_col.update_one({"_id": user["_id"]}, {"$set": {"passwordHash": new_hash}})
 
     token = create_token({
         "id": str(user["_id"]),
@@ -2,6 +2,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from app.blockchain_client import create_batch, get_batch, list_batches
+from app.resilience import CircuitOpenError, BudgetExceeded, with_budget
 import httpx
 
 router = APIRouter(prefix="/api", tags=["batches"])
@@ -19,39 +20,46 @@ class BatchCreate(BaseModel):
     geoScore: int
     notes: str | None = None
 
+def _bridge_error(e: httpx.HTTPError) -> HTTPException:
+    """Maps a Fabric bridge failure to the response the API returns."""
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
+    if isinstance(e, BudgetExceeded):
+        return HTTPException(status_code=504, detail="Fabric bridge did not answer in time")
+    if isinstance(e, httpx.HTTPStatusError):
+        # Pass through error from bridge/Fabric
+        try:
+            detail = e.response.json()
+        except ValueError:
+            detail = None
+        return HTTPException(
+            status_code=500,
+            detail=detail.get("error") if isinstance(detail, dict) and detail.get("error") else str(e),
+        )
+    # Transport errors (refused connection, timeout): the bridge is unreachable
+    return HTTPException(status_code=502, detail=f"Fabric bridge unavailable: {e}")
+
 @router.post("/batches")
 async def create_batch_endpoint(batch: BatchCreate):
     try:
-        result = await create_batch(batch.dict())
+        # Bounded by the fabric_proxy latency budget instead of the full read timeout
+        result = await with_budget("fabric_proxy", create_batch(batch.dict()))
         return result
     except httpx.HTTPError as e:
-        # Pass through error from bridge/Fabric
-        detail = getattr(e.response, "json", lambda: {})()
-        raise HTTPException(
-            status_code=500,
-            detail=detail.get("error") if isinstance(detail, dict) else str(e),
-        )
+        raise _bridge_error(e)
 
 @router.get("/batches/{batch_id}")
 async def get_batch_endpoint(batch_id: str):
     try:
-        result = await get_batch(batch_id)
+        result = await with_budget("fabric_proxy", get_batch(batch_id))
         return result
     except httpx.HTTPError as e:
-        detail = getattr(e.response, "json", lambda: {})()
-        raise HTTPException(
-            status_code=500,
-            detail=detail.get("error") if isinstance(detail, dict) else str(e),
-        )
+        raise _bridge_error(e)
 
 @router.get("/batches")
 async def list_batches_endpoint():
     try:
-        result = await list_batches()
+        result = await with_budget("fabric_proxy", list_batches())
         return result
     except httpx.HTTPError as e:
-        detail = getattr(e.response, "json", lambda: {})()
-        raise HTTPException(
-            status_code=500,
-            detail=detail.get("error") if isinstance(detail, dict) else str(e),
-        )
+        raise _bridge_error(e)
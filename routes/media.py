@@ -0,0 +1,130 @@
+# backend/routes/media.py
+#
+# Caching IPFS gateway proxy. Content is immutable per CID, so responses are
+# cacheable forever by browsers and CDNs, and the local disk cache
+# (app/media_cache.py) never needs invalidation.
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from app import media_cache
+
+router = APIRouter(tags=["media"])
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parses a single "bytes=" range into inclusive (start, end).
+    Returns None for absent or multi-range headers (served as a full 200);
+    raises 416 for ranges that cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_s == "":
+            # Suffix range: the last N bytes
+            length = int(end_s)
+            if length <= 0:
+                raise ValueError
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise HTTPException(416, "Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+def _serve_cached(entry: dict, etag: str, range_header: str | None):
+    size = entry["size"]
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE,
+        "Accept-Ranges": "bytes",
+    }
+    byte_range = _parse_range(range_header, size)
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            media_cache.iter_file(entry["path"], 0, size - 1),
+            media_type=entry["content_type"],
+            headers=headers,
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        media_cache.iter_file(entry["path"], start, end),
+        status_code=206,
+        media_type=entry["content_type"],
+        headers=headers,
+    )
+
+
+def _copy_length(upstream, headers: dict):
+    # The body is relayed decoded, so a length declared for an encoded body does not apply
+    length = upstream.headers.get("content-length")
+    if length and upstream.headers.get("content-encoding", "identity") == "identity":
+        headers["Content-Length"] = length
+
+
+def _relay_range(etag: str, upstream):
+    """Relays the gateway's answer to a Range request (206, or 200 if it ignored the range)."""
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE, "Accept-Ranges": "bytes"}
+    _copy_length(upstream, headers)
+    if upstream.status_code == 206 and upstream.headers.get("content-range"):
+        headers["Content-Range"] = upstream.headers["content-range"]
+    return StreamingResponse(
+        media_cache.relay(upstream),
+        status_code=upstream.status_code,
+        media_type=upstream.headers.get("content-type", "application/octet-stream"),
+        headers=headers,
+    )
+
+
+async def _from_gateway(awaitable):
+    try:
+        return await awaitable
+    except media_cache.GatewayError as e:
+        raise HTTPException(e.status_code, str(e))
+    except Exception:
+        raise HTTPException(502, "IPFS gateway unreachable")
+
+
+@router.get("/media/{cid}")
+async def get_media(cid: str, request: Request):
+    """Serves IPFS content from the local cache, filling misses from the gateway."""
+    if not media_cache.is_valid_cid(cid):
+        raise HTTPException(400, "Invalid CID")
+
+    etag = f'"{cid}"'
+    if request.headers.get("if-none-match") in (etag, f"W/{etag}", "*"):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE})
+
+    range_header = request.headers.get("range")
+    entry = media_cache.lookup(cid)
+    if entry is None and range_header:
+        # Ranges are served from disk, so fetch the object completely first
+        entry = await _from_gateway(media_cache.fill(cid))
+        if entry is None:
+            # Too large to cache: let the gateway serve the range
+            return _relay_range(etag, await _from_gateway(media_cache.open_upstream(cid, range_header)))
+    if entry is not None:
+        return _serve_cached(entry, etag, range_header)
+
+    # Plain miss (or object too large to cache): stream through, caching as we go
+    upstream = await _from_gateway(media_cache.open_upstream(cid))
+
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE, "Accept-Ranges": "bytes"}
+    _copy_length(upstream, headers)
+    return StreamingResponse(
+        media_cache.stream_and_cache(cid, upstream),
+        media_type=upstream.headers.get("content-type", "application/octet-stream"),
+        headers=headers,
+    )
@@ -0,0 +1,15 @@
+# backend/routes/metrics.py
+
+from fastapi import APIRouter
+from datetime import datetime
+from app import metrics
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics")
+async def get_metrics():
+    """In-process runtime metrics: circuit breakers, caches, queues."""
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        **metrics.snapshot(),
+    }
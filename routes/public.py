@@ -1,131 +1,118 @@
 # backend/routes/public.py (FINAL VERSION)
 
-from fastapi import APIRouter, HTTPException
+import os
+import json
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from app.database import batches_col
-from app.ipfs_handler import get_public_url
-from app.models.public import PublicBatchDetails, Stage, MediaItem
-from app.blockchain_client import verify_token
-from datetime import datetime
-from typing import List
+from app.models.public import PublicBatchDetails, BulkScanRequest
+from app.verification_cache import get_verification
+from app.resilience import with_budget
+from app import public_scan
 
 router = APIRouter()
 
-def _format_date(dt: object) -> str:
-    """Safely formats a datetime object or returns N/A."""
-    return dt.strftime('%Y-%m-%d %H:%M') if isinstance(dt, datetime) else "N/A"
+BULK_VERIFY_CONCURRENCY = int(os.getenv("BULK_VERIFY_CONCURRENCY", "16"))
+
+async def _verify(product_unit_id: str) -> dict:
+    # --- CRITICAL: Live Public Chain Verification ---
+    # Bounded by the public_scan_verify latency budget; a slow upstream yields a
+    # degraded badge while the (shared) lookup keeps filling the cache.
+    return await with_budget(
+        "public_scan_verify",
+        get_verification(product_unit_id),
+        fallback={"verified": False, "degraded": True},
+    )
 
 @router.get("/api/public/scan/{product_unit_id}", response_model=PublicBatchDetails, tags=["public"])
-async def public_consumer_scan(product_unit_id: str):
+async def public_consumer_scan(product_unit_id: str, request: Request):
     """
     Public, unauthenticated endpoint to fetch the full verified supply chain journey.
     It searches by the unique Product Unit ID (from the QR code), with a fallback to Batch ID.
+    Packaged products are served from an immutable snapshot with a strong ETag.
     """
-    
-    # 1. Search for the batch document using the unique Product Unit ID
-    batch_doc = await batches_col.find_one({
-        "packaging_data.unit_id": product_unit_id
-    })
-    
-    # 2. Fallback: If not found by unit ID, try searching by the raw batch_id
-    if not batch_doc:
-         batch_doc = await batches_col.find_one({"batch_id": product_unit_id})
-    
+
+    # 1. Packaged products: snapshot + badge overlay
+    snapshot = await public_scan.get_snapshot(product_unit_id)
+    if snapshot:
+        payload, etag = public_scan.render(snapshot, await _verify(product_unit_id))
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(payload, headers=headers)
+
+    # 2. Everything else is built live from the batch document
+    batch_doc = await public_scan.find_batch(product_unit_id)
+
     if not batch_doc:
         raise HTTPException(status_code=404, detail=f"Product or Batch ID {product_unit_id} not found.")
 
-    packaging_info = batch_doc.get('packaging_data', {})
-    
-    # --- CRITICAL: Live Public Chain Verification ---
-    verification_result = await verify_token(product_unit_id) 
-    is_verified_public = verification_result.get("verified", False)
-    public_chain_tx = verification_result.get("txHash") 
-    
-    # -------------------------------------------------------------
-    
-    stages_list: List[Stage] = []
-    stage_counter = 1
-    collector_info = batch_doc.get('collector_data', {})
-    
-    # 1. Growth Stages (Source: Collector's proof in growth_data)
-    for i in range(1, 6):
-        stage_key = f"stage_{i}"
-        stage_data = batch_doc.get('growth_data', {}).get(stage_key)
-
-        if stage_data and stage_data.get('cid'):
-            photos = [MediaItem(
-                id=1,
-                title=f"Verification Photo",
-                url=get_public_url(stage_data['cid']),
-                description=stage_data.get('notes', 'Collector verification proof.')
-            )]
-            
-            stages_list.append(Stage(
-                id=stage_counter,
-                name=f"Cultivation Stage {i} Verified",
-                date=_format_date(stage_data.get('updated_at')),
-                location=batch_doc.get('location', 'Farm Location'),
-                description=f"Stage {i} proof submitted by Collector {collector_info.get('name', 'N/A')}.",
-                photos=photos,
-            ))
-            stage_counter += 1
-
-    # 2. Lab Testing Stage (Source: lab_data)
-    lab_data = batch_doc.get('lab_data')
-    if lab_data and lab_data.get('report_cid') and lab_data.get('submitted_at'):
-        report_cid = lab_data['report_cid']
-        
-        photos = [MediaItem(
-            id=1,
-            title="Official Lab Test Report",
-            url=get_public_url(report_cid),
-            description=f"Purity Test Results: {'Passed' if lab_data.get('results', {}).get('passed') else 'Failed'}."
-        )]
-        
-        stages_list.append(Stage(
-            id=stage_counter,
-            name="Quality Testing & Lab Verification",
-            date=_format_date(lab_data.get('submitted_at')),
-            location=f"Lab Tester: {lab_data.get('tester_name', 'N/A')}",
-            description=f"Batch tested and confirmed {batch_doc.get('status').upper()} for purity.",
-            photos=photos,
-        ))
-        stage_counter += 1
-
-    # 3. Manufacturing & Packaging Stage
-    mfg_data = batch_doc.get('manufacturer_data') 
-    mfg_submission = batch_doc.get('manufacturing_data', {})
-    
-    if batch_doc.get('status') in ["manufacturing_done", "packaged"] and mfg_data: 
-        mfg_date = batch_doc.get('packaged_at') or mfg_submission.get('submitted_at')
-        
-        stages_list.append(Stage(
-            id=stage_counter,
-            name="Manufacturing & Final Packaging",
-            date=_format_date(mfg_date),
-            location=mfg_data.get('name', 'GMP Facility'),
-            description=f"Product packaged by {mfg_data.get('name')}. Final Product ID: {packaging_info.get('unit_id', product_unit_id)}.",
-            photos=[], 
-        ))
-        stage_counter += 1
-
-    # --- Final Construction and Status Determination ---
-    display_id = packaging_info.get('unit_id') or product_unit_id
-    
-    final_status = batch_doc.get('status', 'PENDING')
-    
-    # Override status based on public chain verification for the consumer view
-    if final_status == 'packaged' and is_verified_public:
-        final_status = 'VERIFIED_ON_PUBLIC_CHAIN'
-    elif final_status == 'packaged' and not is_verified_public:
-        final_status = 'WARNING_PUBLIC_ANCHOR_MISSING' 
+    if batch_doc.get("status") == "packaged" and batch_doc.get("packaging_data", {}).get("unit_id"):
+        # Packaged before snapshots (or this snapshot format) existed: materialize on first scan
+        snapshot = await public_scan.materialize(batch_doc)
+        payload, etag = public_scan.render(snapshot, await _verify(product_unit_id))
+        return JSONResponse(payload, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
     return PublicBatchDetails(
-        productName=batch_doc.get('herb_name', 'Herbal Product'),
-        batchId=display_id,
-        status=final_status,
-        farmerName=batch_doc.get('farmer_name', 'N/A'),
-        farmLocation=batch_doc.get('location', 'N/A'),
-        # Prioritize the Public Chain TX Hash, fallback to Fabric TX Hash
-        blockchainTxHash=public_chain_tx or packaging_info.get('fabric_final_tx'),
-        processingStages=stages_list,
-    )
\ No newline at end of file
+        **public_scan.resolve_media(public_scan.build_journey(batch_doc, product_unit_id)),
+        **public_scan.build_badge(
+            batch_doc.get('status'),
+            await _verify(product_unit_id),
+            batch_doc.get('packaging_data', {}).get('fabric_final_tx'),
+        ),
+        anchorProofs=await public_scan.build_anchor_proofs(batch_doc.get('anchors', {})),
+    )
+
+
+@router.post("/api/public/scan/bulk", tags=["public"])
+async def public_bulk_scan(body: BulkScanRequest):
+    """
+    Verifies many product units at once (a distributor's pallet).
+    Units are resolved with a single query; chain verification runs with at
+    most BULK_VERIFY_CONCURRENCY lookups in flight. Results stream back as
+    NDJSON, one line per unit, in completion order.
+    """
+    unit_ids = list(dict.fromkeys(body.unitIds))
+    docs = {
+        doc["packaging_data"]["unit_id"]: doc
+        async for doc in batches_col.find(
+            {"packaging_data.unit_id": {"$in": unit_ids}},
+            {"batch_id": 1, "herb_name": 1, "status": 1, "packaging_data": 1},
+        )
+    }
+    semaphore = asyncio.Semaphore(BULK_VERIFY_CONCURRENCY)
+
+    async def verify_unit(unit_id: str) -> dict:
+        doc = docs[unit_id]
+        async with semaphore:
+            verification = await with_budget(
+                "public_scan_bulk_verify",
+                get_verification(unit_id),
+                fallback={"verified": False, "degraded": True},
+            )
+        return {
+            "unitId": unit_id,
+            "found": True,
+            "batchId": doc["batch_id"],
+            "productName": doc.get("herb_name", "Herbal Product"),
+            **public_scan.build_badge(
+                doc.get("status"), verification, doc["packaging_data"].get("fabric_final_tx")
+            ),
+        }
+
+    async def stream():
+        for unit_id in unit_ids:
+            if unit_id not in docs:
+                yield json.dumps({"unitId": unit_id, "found": False}) + "\n"
+
+        tasks = [asyncio.create_task(verify_unit(u)) for u in unit_ids if u in docs]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away: stop the remaining lookups
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
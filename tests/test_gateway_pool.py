@@ -0,0 +1,60 @@
+# tests/test_gateway_pool.py
+#
+# Hedged gateway requests against stub gateways (httpx.MockTransport).
+
+import asyncio
+import httpx
+import pytest
+
+from app import gateway_pool, http_clients
+
+
+class _Body(httpx.AsyncByteStream):
+    def __init__(self, log):
+        self.log = log
+
+    async def __aiter__(self):
+        yield b"data"
+
+    async def aclose(self):
+        self.log["closed"] += 1
+
+
+@pytest.fixture
+def gateways(monkeypatch):
+    log = {"opened": 0, "closed": 0, "delay": 0.2}
+
+    async def handler(request):
+        await asyncio.sleep(log["delay"])
+        log["opened"] += 1
+        return httpx.Response(200, stream=_Body(log))
+
+    monkeypatch.setattr(gateway_pool, "GATEWAY_PROBE_TIMEOUT", 0.05)
+    monkeypatch.setattr(gateway_pool, "_gateways", [
+        gateway_pool.Gateway("http://a.test/ipfs/"), gateway_pool.Gateway("http://b.test/ipfs/"),
+    ])
+    monkeypatch.setitem(http_clients._clients, "gateway", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return log
+
+
+def test_cancelled_caller_leaves_no_open_responses(gateways):
+    async def scenario():
+        caller = asyncio.create_task(gateway_pool.open_hedged("QmCid"))
+        await asyncio.sleep(0.1)  # past the hedge delay: both gateways are in flight
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0.3)
+
+    asyncio.run(scenario())
+    assert gateways["opened"] == gateways["closed"]
+
+
+def test_hedge_loser_is_closed(gateways):
+    async def scenario():
+        response = await gateway_pool.open_hedged("QmCid")
+        await asyncio.sleep(0.3)
+        await response.aclose()
+
+    asyncio.run(scenario())
+    assert gateways["opened"] == gateways["closed"]
@@ -0,0 +1,96 @@
+# tests/test_media_proxy.py
+#
+# /api/media/{cid} against a stub IPFS gateway (httpx.MockTransport installed
+# as the pooled "gateway" client).
+
+import gzip
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import gateway_pool, http_clients, media_cache
+from routes.media import router
+
+CID = "QmStubObject0000000000000000000000000000000001"
+BODY = bytes(range(256)) * 20  # 5120 bytes
+
+
+@pytest.fixture
+def gateway(monkeypatch, tmp_path):
+    """Stub gateway serving BODY; honours Range and gzips when allowed to. Returns its log."""
+    log = {"requests": [], "bytes_sent": 0, "force_gzip": False}
+
+    def handler(request):
+        log["requests"].append(request)
+        headers = {"content-type": "application/octet-stream"}
+        body, status = BODY, 200
+        if request.headers.get("range"):
+            start, end = (int(x) for x in request.headers["range"][len("bytes="):].split("-"))
+            body, status = BODY[start:end + 1], 206
+            headers["content-range"] = f"bytes {start}-{end}/{len(BODY)}"
+        elif log["force_gzip"] or "gzip" in request.headers.get("accept-encoding", ""):
+            body = gzip.compress(body)
+            headers["content-encoding"] = "gzip"
+        headers["content-length"] = str(len(body))
+
+        async def stream():
+            for i in range(0, len(body), 512):
+                log["bytes_sent"] += len(body[i:i + 512])
+                yield body[i:i + 512]
+
+        return httpx.Response(status, headers=headers, content=stream())
+
+    monkeypatch.setattr(media_cache, "MEDIA_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(media_cache, "MEDIA_CACHE_MAX_OBJECT_BYTES", 1000)
+    monkeypatch.setattr(media_cache, "_index", media_cache._index.__class__())
+    monkeypatch.setattr(media_cache, "_total_bytes", 0)
+    monkeypatch.setattr(gateway_pool, "_gateways", [gateway_pool.Gateway("http://gateway.test/ipfs/")])
+    monkeypatch.setitem(http_clients._clients, "gateway", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return log
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    return TestClient(app)
+
+
+def test_range_on_uncacheable_object_is_relayed_upstream(gateway, client):
+    res = client.get(f"/api/media/{CID}", headers={"Range": "bytes=0-99"})
+
+    assert res.status_code == 206
+    assert res.content == BODY[:100]
+    assert res.headers["content-range"] == f"bytes 0-99/{len(BODY)}"
+    # The full GET is dropped after its headers; only the range is transferred
+    assert [r.headers.get("range") for r in gateway["requests"]] == [None, "bytes=0-99"]
+    assert gateway["bytes_sent"] <= 512 + 100
+
+
+def test_range_on_cacheable_object_is_served_from_disk(gateway, client, monkeypatch):
+    monkeypatch.setattr(media_cache, "MEDIA_CACHE_MAX_OBJECT_BYTES", 10_000)
+
+    first = client.get(f"/api/media/{CID}", headers={"Range": "bytes=100-199"})
+    second = client.get(f"/api/media/{CID}", headers={"Range": "bytes=-10"})
+
+    assert (first.status_code, first.content) == (206, BODY[100:200])
+    assert (second.status_code, second.content) == (206, BODY[-10:])
+    assert len(gateway["requests"]) == 1
+
+
+def test_content_length_matches_relayed_body(gateway, client):
+    res = client.get(f"/api/media/{CID}")
+
+    assert res.content == BODY
+    assert gateway["requests"][0].headers["accept-encoding"] == "identity"
+    assert int(res.headers["content-length"]) == len(res.content)
+
+
+def test_encoded_upstream_length_is_not_forwarded(gateway, client):
+    gateway["force_gzip"] = True
+    res = client.get(f"/api/media/{CID}")
+
+    assert res.content == BODY
+    assert "content-encoding" not in res.headers
+    assert int(res.headers.get("content-length", len(res.content))) == len(res.content)
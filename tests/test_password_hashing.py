@@ -0,0 +1,77 @@
+# tests/test_password_hashing.py
+#
+# Password hashing runs in the bounded pwhash pool, so a login storm must not
+# stall the event loop. The storm measurement prints its numbers with
+# `pytest -s tests/test_password_hashing.py`.
+
+import time
+import asyncio
+from passlib.context import CryptContext
+
+from routes import auth
+
+LOGINS = 32
+
+
+async def _max_loop_stall(work) -> tuple[float, float]:
+    """Runs `work` while a 1 ms ticker records the longest gap between ticks."""
+    stall = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal stall
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stall = max(stall, now - last)
+            last = now
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick
+    return stall, elapsed
+
+
+def test_login_storm_does_not_stall_event_loop():
+    stored = auth.pwd_ctx.hash("correct horse")
+    started = time.perf_counter()
+    auth.pwd_ctx.verify("correct horse", stored)
+    one_verify = time.perf_counter() - started
+
+    async def inline_storm():
+        for _ in range(LOGINS):
+            auth.pwd_ctx.verify("correct horse", stored)
+
+    async def pooled_storm():
+        results = await asyncio.gather(*(auth.verify_password("correct horse", stored) for _ in range(LOGINS)))
+        assert all(valid for valid, _ in results)
+
+    inline_stall, inline_elapsed = asyncio.run(_max_loop_stall(inline_storm))
+    pooled_stall, pooled_elapsed = asyncio.run(_max_loop_stall(pooled_storm))
+
+    print(
+        f"\n{LOGINS} logins, {auth.PASSWORD_HASH_ROUNDS} rounds, {auth.PASSWORD_HASH_WORKERS} workers: "
+        f"one verify {one_verify * 1000:.1f} ms\n"
+        f"  inline: max loop stall {inline_stall * 1000:.1f} ms, {LOGINS / inline_elapsed:.0f} logins/s\n"
+        f"  pooled: max loop stall {pooled_stall * 1000:.1f} ms, {LOGINS / pooled_elapsed:.0f} logins/s"
+    )
+    # Inline, the loop is blocked for the whole storm; pooled, it keeps ticking
+    assert inline_stall >= one_verify * LOGINS * 0.5
+    assert pooled_stall < max(one_verify, 0.02)
+
+
+def test_outdated_hash_is_upgraded_on_login():
+    weak = CryptContext(schemes=["pbkdf2_sha256"], pbkdf2_sha256__default_rounds=1000).hash("secret1")
+
+    valid, new_hash = asyncio.run(auth.verify_password("secret1", weak))
+    assert valid and new_hash
+    assert auth.pwd_ctx.identify(new_hash) == "pbkdf2_sha256"
+    assert f"${auth.PASSWORD_HASH_ROUNDS}$" in new_hash
+
+    valid, new_hash = asyncio.run(auth.verify_password("secret1", new_hash))
+    assert valid and new_hash is None
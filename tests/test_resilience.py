@@ -0,0 +1,116 @@
+# tests/test_resilience.py
+#
+# Circuit breaker and latency budget behaviour against a stub Fabric bridge
+# (httpx.MockTransport installed as the pooled "fabric" client).
+
+import time
+import asyncio
+import httpx
+import pytest
+
+from app import blockchain_client, http_clients, resilience
+from app.resilience import CircuitBreaker, CircuitOpenError, BudgetExceeded, with_budget
+
+
+@pytest.fixture
+def bridge(monkeypatch):
+    """Stub bridge whose behaviour tests switch via `mode`; returns its state."""
+    state = {"mode": "ok", "calls": 0}
+
+    async def handler(request):
+        state["calls"] += 1
+        if state["mode"] == "slow":
+            await asyncio.sleep(1)
+        if state["mode"] == "fail":
+            return httpx.Response(503, json={"error": "bridge down"})
+        return httpx.Response(200, json={"batchId": "B1"})
+
+    monkeypatch.setattr(resilience, "BREAKER_MIN_CALLS", 4)
+    monkeypatch.setattr(resilience, "BREAKER_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(resilience, "BREAKER_OPEN_SECONDS", 0.1)
+    monkeypatch.setattr(resilience, "BREAKER_HALF_OPEN_PROBES", 1)
+    monkeypatch.setitem(resilience.LATENCY_BUDGETS_MS, "fabric_proxy", 50)
+    monkeypatch.setattr(blockchain_client, "fabric_breaker", CircuitBreaker("fabric"))
+    monkeypatch.setitem(http_clients._clients, "fabric", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return state
+
+
+async def _calls(n: int):
+    """Makes n proxied calls; returns how many failed fast with CircuitOpenError."""
+    rejected = 0
+    for _ in range(n):
+        try:
+            await with_budget("fabric_proxy", blockchain_client.get_batch("B1"))
+        except CircuitOpenError:
+            rejected += 1
+        except httpx.HTTPError:
+            pass
+    return rejected
+
+
+def test_failing_upstream_opens_breaker(bridge):
+    async def scenario():
+        bridge["mode"] = "fail"
+        rejected = await _calls(10)
+        return rejected, blockchain_client.fabric_breaker.state
+
+    rejected, state = asyncio.run(scenario())
+    assert state == resilience.OPEN
+    assert rejected == 6
+    assert bridge["calls"] == 4
+
+
+def test_slow_upstream_is_cut_by_budget_and_trips_breaker(bridge):
+    async def scenario():
+        bridge["mode"] = "slow"
+        started = time.monotonic()
+        with pytest.raises(BudgetExceeded):
+            await with_budget("fabric_proxy", blockchain_client.get_batch("B1"))
+        elapsed = time.monotonic() - started
+        await _calls(5)
+        return elapsed, blockchain_client.fabric_breaker.state
+
+    elapsed, state = asyncio.run(scenario())
+    assert elapsed < 0.5
+    assert state == resilience.OPEN
+    assert bridge["calls"] == 4
+
+
+def test_open_half_open_closed(bridge):
+    async def scenario():
+        breaker = blockchain_client.fabric_breaker
+        bridge["mode"] = "fail"
+        await _calls(4)
+        assert breaker.state == resilience.OPEN
+
+        # Failed probe re-opens
+        await asyncio.sleep(0.15)
+        await _calls(1)
+        assert breaker.state == resilience.OPEN
+
+        # Successful probe closes
+        bridge["mode"] = "ok"
+        await asyncio.sleep(0.15)
+        assert await blockchain_client.get_batch("B1") == {"batchId": "B1"}
+        return breaker.state
+
+    assert asyncio.run(scenario()) == resilience.CLOSED
+
+
+def test_cancelled_probe_gives_no_verdict(bridge):
+    async def scenario():
+        breaker = blockchain_client.fabric_breaker
+        bridge["mode"] = "fail"
+        await _calls(4)
+        await asyncio.sleep(0.15)
+
+        # A caller going away mid-probe must neither close nor re-open the breaker
+        bridge["mode"] = "slow"
+        probe = asyncio.create_task(blockchain_client.get_batch("B1"))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return breaker.state, breaker.probes_in_flight
+
+    assert asyncio.run(scenario()) == (resilience.HALF_OPEN, 0)
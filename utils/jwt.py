@@ -2,8 +2,13 @@ from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from collections import OrderedDict
+import hashlib
+import time
 import os
 
+from app import metrics
+
 # =========================
 # CONFIG
 # =========================
@@ -12,6 +17,10 @@ SECRET_KEY = os.getenv("JWT_SECRET", "dev-secret")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES", 1440))
 
+# Verified-token cache: sha256(token) -> (payload, expires_at)
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", 10000))
+JWT_CACHE_MAX_TTL = int(os.getenv("JWT_CACHE_MAX_TTL", 300))  # tokens without exp
+
 security = HTTPBearer()
 
 # =========================
@@ -30,20 +39,81 @@ def create_token(data: dict):
 def decode_token(token: str):
     return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
+# =========================
+# VERIFIED TOKEN CACHE
+# =========================
+# A session sends the same bearer token on every request; remember the
+# verified payload until the token's own exp instead of re-verifying it.
+
+_verified: OrderedDict[bytes, tuple[dict, float]] = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "decode_cpu_seconds": 0.0}
+
+
+def _verify_cached(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    entry = _verified.get(key)
+    if entry and now < entry[1]:
+        _stats["hits"] += 1
+        _verified.move_to_end(key)
+        return entry[0]
+
+    started = time.process_time()
+    payload = decode_token(token)  # raises JWTError
+    _stats["decode_cpu_seconds"] += time.process_time() - started
+    _stats["misses"] += 1
+
+    _verified[key] = (payload, float(payload.get("exp", now + JWT_CACHE_MAX_TTL)))
+    _verified.move_to_end(key)
+    while len(_verified) > JWT_CACHE_SIZE:
+        _verified.popitem(last=False)
+    return payload
+
+
+def jwt_cache_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    avg_decode = _stats["decode_cpu_seconds"] / _stats["misses"] if _stats["misses"] else 0.0
+    return {
+        "hits": _stats["hits"],
+        "misses": _stats["misses"],
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else None,
+        "entries": len(_verified),
+        "avg_decode_ms": round(avg_decode * 1000, 3),
+        "cpu_saved_seconds": round(_stats["hits"] * avg_decode, 3),
+    }
+
+
+metrics.register("jwt_cache", jwt_cache_stats)
+
 # =========================
 # FASTAPI DEPENDENCY (THIS IS NEW)
 # =========================
 
-def verify_token(
+async def verify_token(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     token = credentials.credentials
 
     try:
-        payload = decode_token(token)
-        return payload   # {id, role, email, exp}
+        # Copy: callers must not be able to alter the cached payload
+        return dict(_verify_cached(token))   # {id, role, email, exp}
     except JWTError:
         raise HTTPException(
             status_code=401,
             detail="Invalid or expired token"
         )
+
+
+def require_role(*roles: str):
+    """
+    Dependency that verifies the token and checks its role against a set
+    built once, e.g. `user=Depends(require_role("Admin"))`.
+    """
+    allowed = frozenset(roles)
+
+    async def dependency(user: dict = Depends(verify_token)):
+        if user.get("role") not in allowed:
+            raise HTTPException(403)
+        return user
+
+    return dependency
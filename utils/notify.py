@@ -1,5 +1,9 @@
 from datetime import datetime
-from app.database import notification_collection, users_col
+from app.database import notification_collection
+from app import role_directory
+
+# Broadcast targets, expanded to every member of the role
+BROADCASTS = {"ALL_MANUFACTURERS": "Manufacturer", "ALL_TESTERS": "Tester"}
 
 async def notify(
     user_id: str,
@@ -11,10 +15,9 @@ async def notify(
 ):
     recipients = []
 
-    # 🔥 FIX: expand ALL_MANUFACTURERS safely
-    if user_id == "ALL_MANUFACTURERS":
-        async for u in users_col.find({"role": "Manufacturer"}):
-            recipients.append(u["id"])
+    # 🔥 FIX: expand broadcasts from the in-memory role directory
+    if user_id in BROADCASTS:
+        recipients.extend(role_directory.ids(BROADCASTS[user_id]))
     else:
         recipients.append(user_id)
 